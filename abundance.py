@@ -0,0 +1,181 @@
+import hashlib
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Compact representation of the taxa block of the samples file. Most taxa are
+# absent from most samples, so the abundances are kept as a sparse CSR matrix of
+# float32 (one row per sample, one column per taxon) next to the vocabulary of
+# taxon names:
+#   {"matrix": csr_matrix, "missing": boolean csr_matrix of the empty cells,
+#    "taxa": array of names, "columns": {name: column},
+#    "hash": content hash, used to key the caches of results derived from it}
+# Row i of the matrix is the sample with row label i in the metadata frame. Empty
+# cells of the source (taxon not counted in the sample) are 0 in the matrix, so
+# that sums and distances treat them as absent, and are kept in the missing mask,
+# so that the tables and figures of the abundances show them as missing.
+
+
+# float32 keeps about 7 significant digits: values are rounded when converted
+# back to float64, so that 81.6 is shown as 81.6 and not as 81.59999847
+DECIMALS = 5
+
+
+def _as_float64(values):
+    return np.round(np.asarray(values, dtype=np.float64), DECIMALS)
+
+
+# Build the sparse matrix and the missing mask from the taxa columns of the samples frame
+def build_abundance(taxa_data):
+    values = taxa_data.fillna(0).to_numpy(dtype=np.float32)
+    matrix = sparse.csr_matrix(values)
+    matrix.eliminate_zeros()
+    missing = sparse.csr_matrix(taxa_data.isna().to_numpy())
+    taxa = np.asarray(taxa_data.columns, dtype=object)
+    return {
+        "matrix": matrix,
+        "missing": missing,
+        "taxa": taxa,
+        "columns": {name: j for j, name in enumerate(taxa)},
+        "hash": _content_hash(matrix, missing, taxa),
+    }
+
+
+# Stack the abundances of several parts (the samples file and the added studies)
+# into one matrix over the union of their taxa. The vocabulary keeps the taxa of
+# the first part in their order and appends the new taxa of the others as they
+# appear, so the columns of the existing taxa do not move.
+def merge_abundance(parts):
+    columns = {}
+    for part in parts:
+        for name in part["taxa"]:
+            columns.setdefault(name, len(columns))
+    blocks, missing_blocks = [], []
+    for part in parts:
+        mapping = np.array([columns[name] for name in part["taxa"]], dtype=np.int64)
+        for source, target, dtype in ((part["matrix"], blocks, np.float32), (part["missing"], missing_blocks, bool)):
+            block = source.tocoo()
+            target.append(sparse.csr_matrix(
+                (block.data, (block.row, mapping[block.col])), shape=(block.shape[0], len(columns)), dtype=dtype,
+            ))
+    matrix = sparse.vstack(blocks, format="csr")
+    matrix.sort_indices()
+    missing = sparse.vstack(missing_blocks, format="csr")
+    taxa = np.asarray(list(columns), dtype=object)
+    return {
+        "matrix": matrix,
+        "missing": missing,
+        "taxa": taxa,
+        "columns": columns,
+        "hash": _content_hash(matrix, missing, taxa),
+    }
+
+
+def _content_hash(matrix, missing, taxa):
+    digest = hashlib.sha1()
+    for array in (matrix.indptr, matrix.indices, matrix.data, missing.indptr, missing.indices):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    digest.update("\n".join(taxa).encode("utf-8"))
+    return digest.hexdigest()
+
+
+# Approximate memory used by the matrix and the missing mask, in bytes
+def abundance_nbytes(abundance):
+    return sum(
+        matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+        for matrix in (abundance["matrix"], abundance["missing"])
+    )
+
+
+# Names of the taxa with a nonzero abundance in any of the given rows, in column order
+def nonzero_taxa(abundance, rows):
+    columns = np.unique(abundance["matrix"][rows].indices)
+    return abundance["taxa"][columns]
+
+
+# Dense frame of the abundances of the given rows, for the given taxa (all by
+# default), with NaN in the cells that are missing in the source
+def abundance_frame(abundance, rows, taxa=None, index=None):
+    block, missing = abundance["matrix"][rows], abundance["missing"][rows]
+    if taxa is None:
+        taxa = abundance["taxa"]
+    else:
+        columns = [abundance["columns"][name] for name in taxa]
+        block, missing = block[:, columns], missing[:, columns]
+    values = _as_float64(block.toarray())
+    values[missing.toarray()] = np.nan
+    return pd.DataFrame(values, index=index, columns=taxa)
+
+
+# Abundances of the taxa present in the given rows, summed over the rows,
+# as a Series indexed by taxon name in column order
+def summed_abundances(abundance, rows):
+    block = abundance["matrix"][rows]
+    columns = np.unique(block.indices)
+    totals = _as_float64(block[:, columns].sum(axis=0, dtype=np.float64)).ravel()
+    return pd.Series(totals, index=abundance["taxa"][columns])
+
+
+# Abundances of groups of taxa: the columns of the taxa with the same label are
+# summed with one sparse product by a taxa x groups indicator matrix. `labels` has
+# one label per column; the groups are the sorted unique labels. A group is
+# missing in a sample only when all of its taxa are.
+def aggregate_abundance(abundance, labels):
+    groups, inverse = np.unique(np.asarray(labels, dtype=object).astype(str), return_inverse=True)
+    n_taxa = len(abundance["taxa"])
+    indicator = sparse.csr_matrix(
+        (np.ones(n_taxa, dtype=np.float32), (np.arange(n_taxa), inverse)), shape=(n_taxa, len(groups)),
+    )
+    matrix = (abundance["matrix"] @ indicator).tocsr()
+    matrix.eliminate_zeros()
+    matrix.sort_indices()
+    counts = (abundance["missing"].astype(np.float32) @ indicator).tocoo()
+    complete = counts.data == np.bincount(inverse, minlength=len(groups))[counts.col]
+    missing = sparse.csr_matrix(
+        (np.ones(int(complete.sum()), dtype=bool), (counts.row[complete], counts.col[complete])), shape=matrix.shape,
+    )
+    taxa = np.asarray(groups, dtype=object)
+    return {
+        "matrix": matrix,
+        "missing": missing,
+        "taxa": taxa,
+        "columns": {name: j for j, name in enumerate(taxa)},
+        "hash": _content_hash(matrix, missing, taxa),
+    }
+
+
+# Mean abundances of groups of rows (e.g. the samples of each station), computed
+# with one sparse product by a groups x rows averaging matrix. `groups` gives the
+# group (0 to n_groups - 1) of every row. Returns a dense groups x taxa frame over
+# the taxa present in any of the rows, in column order.
+def group_means(abundance, rows, groups, n_groups, index=None):
+    rows = np.asarray(rows, dtype=np.int64)
+    groups = np.asarray(groups, dtype=np.int64)
+    sizes = np.bincount(groups, minlength=n_groups)
+    averaging = sparse.csr_matrix(
+        (1.0 / sizes[groups], (groups, np.arange(len(rows)))), shape=(n_groups, len(rows)),
+    )
+    block = abundance["matrix"][rows]
+    columns = np.unique(block.indices)
+    means = averaging @ block[:, columns].astype(np.float64)
+    return pd.DataFrame(_as_float64(means.toarray()), index=index, columns=abundance["taxa"][columns])
+
+
+# Keep the `top` taxa with the largest mean over the rows of a groups x taxa frame,
+# and/or the taxa reaching `minimum` in any row, and sum all the others in one
+# "Others" column, for all rows at once. The kept taxa are sorted from the most to
+# the least abundant on average.
+def bucket_others(table, top=None, minimum=None):
+    values = table.to_numpy()
+    keep = np.ones(values.shape[1], dtype=bool)
+    if minimum is not None:
+        keep &= (values >= minimum).any(axis=0)
+    means = values.mean(axis=0) if len(values) else np.zeros(values.shape[1])
+    order = np.argsort(-np.where(keep, means, -np.inf), kind="stable")[:int(keep.sum())]
+    if top is not None:
+        order = order[:top]
+    bucketed = table.iloc[:, order].copy()
+    others = _as_float64(values.sum(axis=1) - bucketed.to_numpy().sum(axis=1))
+    if len(order) < values.shape[1]:
+        bucketed["Others"] = np.maximum(others, 0)
+    return bucketed
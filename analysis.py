@@ -1,21 +1,23 @@
+import time
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
-
-# Load the data
-def load_data():
-    return pd.read_excel("data/gamze2.xlsx", engine="openpyxl")
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+from similarity import MAX_NEIGHBOURS, METRICS, similar_samples
+from abundance import abundance_frame, bucket_others, group_means, nonzero_taxa
+from caching import cached_figure, cached_result
+from profiling import timed
+from diversity import INDICES
+from schema import with_missing_marks
+from taxonomy import LEVELS, level_abundance, level_version
+from dataset import load_diversity, load_metadata, load_sample_index, sample_options, sample_positions, sample_rows, samples_version
 
 def show_analysis():
     # Add the title and description for the Analysis section
     st.title("Single View")
     
-    # Load the data
-    data = load_data()
-
-    # Remove any columns named 'Unnamed: 0' or similar
-    data = data.loc[:, ~data.columns.str.contains('^Unnamed')]
-
     st.markdown(
         """
         <h2 style=" font-size: 25px;">1-Relative Abundance of Taxa for Each Station/Sample</h2>
@@ -28,12 +30,13 @@ def show_analysis():
         <h3 style=" font-size: 22px;">Step 1</h3>
         """, unsafe_allow_html=True
     )
-    unique_references = data['Reference'].dropna().unique()
-    selected_reference = st.selectbox("Choose a Reference:", unique_references)
+    # Options and rows of each level come from the prebuilt sample index
+    unique_references = sample_options()
+    selected_reference = st.selectbox("Choose a Reference:", unique_references, key="single_view_reference")
 
     if selected_reference:
-        # Filter data for the selected reference
-        filtered_reference_data = data[data['Reference'] == selected_reference]
+        # Rows of the selected reference
+        filtered_reference_data = sample_rows(selected_reference)
 
         # Display map of stations
         st.markdown(
@@ -45,22 +48,10 @@ def show_analysis():
 
         # Ensure Latitude and Longitude columns exist
         if 'Lat' in filtered_reference_data.columns and 'Long' in filtered_reference_data.columns:
-            # Generate map
-            fig_map = px.scatter_mapbox(
-                filtered_reference_data,
-                lat='Lat',
-                lon='Long',
-                color='Station',
-                hover_name='Station',
-                hover_data={'Lat': False, 'Long': False},
-                mapbox_style="open-street-map",
-                zoom=8,  # Adjust zoom level for better visualization
-                height=400
-            )
-            fig_map.update_layout(
-                margin={"r": 0, "t": 0, "l": 0, "b": 0},  # Remove margins for a clean map
-            )
-            st.plotly_chart(fig_map)
+            # Map of the stations, cached per reference
+            fig_map = cached_figure(station_map_figure, samples_version(), selected_reference)
+            with timed("serialize", "station map"):
+                st.plotly_chart(fig_map)
 
         # Dropdown for selecting Station
         st.markdown(
@@ -68,12 +59,10 @@ def show_analysis():
             <h3 style=" font-size: 22px;">Step 2</h3>
             """, unsafe_allow_html=True
         )
-        unique_stations = filtered_reference_data['Station'].dropna().unique()
-        selected_station = st.selectbox("Choose a Station:", unique_stations)
+        unique_stations = sample_options(selected_reference)
+        selected_station = st.selectbox("Choose a Station:", unique_stations, key="single_view_station")
 
         if selected_station:
-            # Filter data for the selected station
-            station_data = filtered_reference_data[filtered_reference_data['Station'] == selected_station]
 
             # Dropdown for selecting Depth_in_core
             st.markdown(
@@ -81,12 +70,12 @@ def show_analysis():
                 <h3 style=" font-size: 22px;">Step 3</h3>
                 """, unsafe_allow_html=True
             )
-            unique_depths = station_data['Depth_in_core'].dropna().unique()
-            selected_depth = st.selectbox("Choose a Depth in Core (Sample):", unique_depths)
+            unique_depths = sample_options(selected_reference, selected_station)
+            selected_depth = st.selectbox("Choose a Depth in Core (Sample):", unique_depths, key="single_view_depth")
 
-            if selected_depth:
-                # Filter data for the selected depth
-                depth_data = station_data[station_data['Depth_in_core'] == selected_depth]
+            if selected_depth is not None:  # Depth 0 cm is a valid sample
+                # Rows of the selected sample
+                depth_data = sample_rows(selected_reference, selected_station, selected_depth)
 
                 # Display station and depth details
                 st.markdown(f"<h3 style='font-size: 22px;'>Details: </h3>", unsafe_allow_html=True)
@@ -94,34 +83,30 @@ def show_analysis():
                 station_details = {
                     "Station": selected_station,
                     "Depth in Core": selected_depth,
-                    "TOC": depth_data['TOC'].iloc[0] if 'TOC' in depth_data.columns else 'N/A',
+                    "TOC": with_missing_marks(depth_data)['TOC'].iloc[0],
                     "Water Depth": depth_data['Water_depth'].iloc[0] if 'Water_depth' in depth_data.columns else 'N/A',
                 }
                 for key, value in station_details.items():
                     st.write(f"**{key}:** {value}")
 
-                # Prepare data for fossil analysis (use existing relative abundance values)
-                fossil_columns = [
-                    col for col in depth_data.columns
-                    if col not in {'Code', 'Reference', 'Type', 'Lat', 'Long', 'L/D/U', 'Size_fraction', 'S', 'N',
-                                   'Unnamed: 450', 'Station', 'TOC', 'Water_depth', 'Depth_in_core'}
-                ]
-
-                fossil_data = depth_data[fossil_columns].sum().reset_index()
-                fossil_data.columns = ['Fossil', 'Relative Abundance']
-                fossil_data = fossil_data[fossil_data['Relative Abundance'] > 0]  # Filter out fossils with zero relative abundance
-                fossil_data = fossil_data.sort_values(by='Relative Abundance', ascending=False)  # Sort by Relative Abundance
-
-                # Group fossils with relative abundance < 2 as 'Others'
-                others_abundance = fossil_data[fossil_data['Relative Abundance'] < 2]['Relative Abundance'].sum()
-                fossil_data = fossil_data[fossil_data['Relative Abundance'] >= 2]
-
-                if others_abundance > 0:
-                    # Add a row for "Others" containing the summed relative abundance of fossils < 2
-                    fossil_data = pd.concat([
-                        fossil_data,
-                        pd.DataFrame([{'Fossil': 'Others', 'Relative Abundance': others_abundance}])
-                    ], ignore_index=True)
+                # Diversity indices of the sample, computed once when the data is loaded
+                indices = load_diversity().loc[depth_data.index[0]]
+                st.write("**Diversity:** " + " · ".join(
+                    f"{name} {format_index(name, indices[name])}" for name in INDICES
+                ))
+                st.write(f"**Dominant taxa:** {indices['Dominant taxa'] or '-'}")
+                st.caption("; ".join(f"{name}: {description}" for name, description in INDICES.items()) + ".")
+
+                # Taxa as recorded, or grouped by accepted name or genus (see taxonomy.py)
+                level = st.radio("Taxonomic level:", LEVELS, horizontal=True, key="single_view_level")
+
+                # Relative abundances of the taxa present in the sample, from the sparse
+                # matrix, with the taxa under 2% summed as 'Others' (see bucket_others)
+                with timed("filter", "sample abundances"):
+                    rows = depth_data.index.to_numpy()
+                    table = bucket_others(group_means(level_abundance(level), rows, np.zeros(len(rows)), 1), minimum=2)
+                fossil_data = table.iloc[0]
+                fossil_data = fossil_data[fossil_data > 0].rename_axis('Fossil').reset_index(name='Relative Abundance')
 
                 # Bar graph of fossils
                 st.markdown(
@@ -132,25 +117,157 @@ def show_analysis():
     
                 st.markdown(f"<p style='font-size: 14px;'>The following bar graph shows the <strong>Relative Abundances</strong> of taxa (taxa with abundances <2% are summed in 'Others') found at Station: {selected_station}, Depth in core: {selected_depth} cm.</p>", unsafe_allow_html=True)
 
-                fig = px.bar(
-                    fossil_data,
-                    y='Fossil',
-                    x='Relative Abundance',
-                    orientation='h',  # Horizontal bar chart
-                    title=f"Relative Abundances of Taxa at Station: {selected_station}, Depth in core: {selected_depth} cm",
-                    labels={'Relative Abundance': 'Relative Abundance (%)', 'Fossil': 'Taxa'},
-                    color='Relative Abundance',
-                    color_continuous_scale='Viridis',
-                    height=700
-                )
-                st.plotly_chart(fig)
+                with timed("figure", "assemblage bar chart"):
+                    fig = px.bar(
+                        fossil_data,
+                        y='Fossil',
+                        x='Relative Abundance',
+                        orientation='h',  # Horizontal bar chart
+                        title=f"Relative Abundances of Taxa at Station: {selected_station}, Depth in core: {selected_depth} cm",
+                        labels={'Relative Abundance': 'Relative Abundance (%)', 'Fossil': 'Taxa'},
+                        color='Relative Abundance',
+                        color_continuous_scale='Viridis',
+                        height=700
+                    )
+                with timed("serialize", "assemblage bar chart"):
+                    st.plotly_chart(fig)
+
+                # Most similar samples of all studies
+                show_similar_samples(depth_data.index[0])
     
     # Empty spaces
     st.write("------")
 
 
+# Value of a diversity index for the details, "-" when it is not defined
+def format_index(name, value):
+    if pd.isna(value):
+        return "-"
+    return f"{value:.0f}" if name == "Taxa" else f"{value:.2f}"
+
+
+# Map of the stations of one reference
+def station_map_figure(reference):
+    filtered_reference_data = sample_rows(reference)
+    fig_map = px.scatter_mapbox(
+        filtered_reference_data,
+        lat='Lat',
+        lon='Long',
+        color='Station',
+        hover_name='Station',
+        hover_data={'Lat': False, 'Long': False},
+        mapbox_style="open-street-map",
+        zoom=8,  # Adjust zoom level for better visualization
+        height=400
+    )
+    fig_map.update_layout(
+        margin={"r": 0, "t": 0, "l": 0, "b": 0},  # Remove margins for a clean map
+    )
+    return fig_map
 
 
+# Table and map of the samples of all studies most similar to the sample at
+# position `row`, looked up in the precomputed neighbour table
+def show_similar_samples(row):
+    st.markdown(
+        """
+        <h3 style=" font-size: 22px;">Similar Samples</h3>
+        <p style="font-size: 14px;">The samples of all studies with the most similar assemblage to the selected sample.</p>
+        """, unsafe_allow_html=True
+    )
+
+    col1, col2 = st.columns(2)
+    with col1:
+        metric = st.selectbox("Dissimilarity:", METRICS, key="similar_samples_metric")
+    with col2:
+        k = st.slider("Number of samples:", 1, MAX_NEIGHBOURS, 10, key="similar_samples_k")
+    exclude_station = st.checkbox("Exclude samples from the same station", value=True, key="similar_samples_exclude")
+
+    with timed("filter", "similar samples"):
+        similar = similar_samples(row, metric, k, exclude_station)
+    if len(similar) < k:
+        st.write(f"Only {len(similar)} similar samples from other stations were found among the {MAX_NEIGHBOURS} nearest samples.")
+
+    st.dataframe(
+        similar[['Reference', 'Station', 'Depth_in_core', 'Water_depth', 'Dissimilarity']]
+        .style.format({'Dissimilarity': '{:.3f}', 'Depth_in_core': '{:g}', 'Water_depth': '{:g}'}),
+        hide_index=True,
+    )
+
+    # Selected sample (red star) and the similar samples colored by dissimilarity
+    fig = cached_figure(similar_samples_figure, samples_version(), row, metric, k, exclude_station)
+    with timed("serialize", "similar samples map"):
+        st.plotly_chart(fig)
+
+
+# Map of the sample at position `row` and of its most similar samples
+def similar_samples_figure(row, metric, k, exclude_station):
+    similar = similar_samples(row, metric, k, exclude_station)
+    fig = px.scatter_mapbox(
+        similar,
+        lat='Lat',
+        lon='Long',
+        color='Dissimilarity',
+        hover_name='Station',
+        hover_data={'Reference': True, 'Depth_in_core': True, 'Dissimilarity': ':.3f', 'Lat': False, 'Long': False},
+        color_continuous_scale='Viridis',
+        mapbox_style="open-street-map",
+        zoom=7,
+        center={"lat": 40.8, "lon": 28.5},
+        height=400
+    )
+    fig.update_traces(marker=dict(opacity=0.8, size=10))
+    sample = load_metadata().iloc[[row]]
+    fig.add_trace(go.Scattermapbox(
+        lat=sample['Lat'],
+        lon=sample['Long'],
+        mode='markers',
+        marker=dict(size=16, color='red'),
+        name='Selected sample',
+        hovertext=sample['Station'].astype(str),
+        hoverinfo='text',
+        showlegend=False,
+    ))
+    fig.update_layout(margin={"r": 0, "t": 0, "l": 0, "b": 0})
+    return fig
+
+
+# Depth profiles of all taxa of a station, computed in one pass over the station's
+# depth x taxa matrix. A taxon is kept if its abundances sum to more than 2; its
+# values are then normalized to percentages of that sum. Returns a long frame with
+# one row per (taxon, depth): Taxon, Depth_in_core, Relative Abundance, sorted by
+# taxon (in column order) and depth. The taxa are grouped at the taxonomic `level`.
+def build_depth_profiles(reference, station, level="Taxon"):
+    abundance = level_abundance(level)
+    rows = sample_positions(reference, station)
+    # Only the taxa found at the station, as a dense depth x taxa block
+    taxa = nonzero_taxa(abundance, rows)
+    depths = sample_rows(reference, station)['Depth_in_core'].to_numpy(dtype=float)
+    values = abundance_frame(abundance, rows, taxa).to_numpy(dtype=float)
+
+    # Samples with a depth and a count of the taxon (missing abundances are NaN)
+    present = ~np.isnan(values) & ~np.isnan(depths)[:, None]
+    totals = np.where(present, values, 0).sum(axis=0)
+    valid = totals > 2
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        percentages = values[:, valid] / totals[valid] * 100
+    present = present[:, valid]
+
+    # Long format, ordered by taxon and then by depth
+    order = np.argsort(depths, kind='stable')
+    sample_idx, taxon_idx = np.nonzero(present[order].T)[::-1]
+    sample_idx = order[sample_idx]
+    return pd.DataFrame({
+        'Taxon': taxa[valid][taxon_idx],
+        'Depth_in_core': depths[sample_idx],
+        'Relative Abundance': percentages[sample_idx, taxon_idx],
+    })
+
+
+# Depth profiles of a station, shared by all sessions (do not modify the frame)
+def depth_profiles(reference, station, level="Taxon"):
+    return cached_result(build_depth_profiles, level_version(level), reference, station, level)
 
 
 #second part with area graphs
@@ -162,50 +279,39 @@ def show_depth_analysis():
         """ , unsafe_allow_html=True
     )
 
-    # Load the data
-    data = load_data()
-
-    # Remove any columns with names containing 'Unnamed'
-    data = data.loc[:, ~data.columns.str.contains('^Unnamed')]
-
     # Dropdown for selecting Reference
     st.markdown(
         """
         <h3 style=" font-size: 22px;">Step 1</h3>
         """ , unsafe_allow_html=True
     )
-    unique_references = data['Reference'].dropna().unique()
+    unique_references = sample_options()
     selected_reference = st.selectbox("Choose a Reference:", unique_references, key="depth_analysis_reference")
 
     if selected_reference:
-        # Filter data for the selected reference
-        filtered_reference_data = data[data['Reference'] == selected_reference]
-
         # Dropdown for selecting Station
         st.markdown(
         """
         <h3 style=" font-size: 22px;">Step 2</h3>
         """ , unsafe_allow_html=True
     )
-        unique_stations = filtered_reference_data['Station'].dropna().unique()
+        unique_stations = sample_options(selected_reference)
         selected_station = st.selectbox("Choose a Station:", unique_stations, key="depth_analysis_station")
 
         if selected_station:
-            # Filter data for the selected station
-            station_data = filtered_reference_data[filtered_reference_data['Station'] == selected_station]
-
             # Check if the station has only one unique Depth_in_core value
-            if station_data['Depth_in_core'].nunique() == 1:
+            if len(sample_options(selected_reference, selected_station)) == 1:
                 # Show a message and do not display any graphs
                 st.write("This station has only one sample, so no graphs can be shown due to lack of depth variation.")
                 return  # Exit the function early to prevent further processing
 
-            # Prepare data for fossil analysis
-            fossil_columns = [
-                col for col in station_data.columns
-                if col not in {'Code', 'Reference', 'Type', 'Lat', 'Long', 'L/D/U', 'Size_fraction', 'S', 'N',
-                               'Unnamed: 450', 'Station', 'TOC', 'Water_depth', 'Depth_in_core'}
-            ]
+            # Taxa as recorded, or grouped by accepted name or genus (see taxonomy.py)
+            level = st.radio("Taxonomic level:", LEVELS, horizontal=True, key="depth_analysis_level")
+
+            # Depth profiles of the taxa with enough data (computed once per station and level)
+            with timed("filter", "depth profiles"):
+                profiles = depth_profiles(selected_reference, selected_station, level)
+            profiles_by_fossil = dict(tuple(profiles.groupby('Taxon', sort=False)))
 
             # Prepare line graphs for each fossil
             st.markdown(""" <div style="text-align: justify; font-size: 14px;">
@@ -213,89 +319,253 @@ def show_depth_analysis():
         </div>""", unsafe_allow_html=True
     )
 
+            # Layout of the graphs: all taxa in one figure with a shared depth axis,
+            # or the former grid with one figure per taxon
+            layout = st.radio(
+                "Graph layout:", ["Single figure", "One graph per taxon"],
+                horizontal=True, key="depth_analysis_layout"
+            )
+
             # Create a container for the graphs
             graph_container = st.container()
 
-            # Filter out fossils that have no data (empty fossil data)
-            valid_fossils = []
-            for fossil in fossil_columns:
-                fossil_data = station_data[['Depth_in_core', fossil]].dropna()
-                if not fossil_data.empty and fossil_data[fossil].sum() > 2:
-                    valid_fossils.append(fossil)
+            # Only fossils with data were kept in the profiles
+            valid_fossils = list(profiles_by_fossil)
 
             # Create the graphs only for valid fossils
             with graph_container:
-                # Create rows of columns for displaying graphs
-                num_graphs_per_row = 4
-                rows = (len(valid_fossils) + num_graphs_per_row - 1) // num_graphs_per_row  # Calculate number of rows needed
-
-                # Loop through rows and create columns for each
-                for row_idx in range(rows):
-                    # Create the columns for this row (up to 4 per row)
-                    columns = st.columns(num_graphs_per_row)
-
-                    # Loop through fossils and plot them
-                    for i in range(num_graphs_per_row):
-                        fossil_index = row_idx * num_graphs_per_row + i
-                        if fossil_index < len(valid_fossils):
-                            fossil = valid_fossils[fossil_index]
-                            fossil_data = station_data[['Depth_in_core', fossil]].dropna()
-
-                            # Normalize the fossil data to Relative Abundance
-                            total_abundance = fossil_data[fossil].sum()
-                            if total_abundance > 2:
-                                fossil_data['Relative Abundance'] = (fossil_data[fossil] / total_abundance) * 100  # Normalize to percentage
-
-                                # Sort the data by depth to ensure the line graph is continuous and ordered
-                                fossil_data = fossil_data.sort_values(by='Depth_in_core')  # Sorting by depth to avoid irregular connections
-
-                                # Create the line graph for the fossil
-                                fig = px.line(
-                                    fossil_data,
-                                    x='Relative Abundance',  # Relative Abundance on the X-axis
-                                    y='Depth_in_core',       # Depth_in_core on the Y-axis
-                                    title=fossil,
-                                    labels={'Relative Abundance': 'Relative Abundance (%)', 'Depth_in_core': 'Depth in Core'},
-                                    line_shape='linear')  # Line graph 
-
-                                # Set a fixed x-axis range from 0 to 100 (percentage scale)
-                                fig.update_layout(
-                                    title=dict(
-                                    text=fossil,
-                                    font=dict(size=10),  # Set a smaller font size for the title
-                                    x=0.5,
-                                    xanchor='center',
-                                    yanchor='top',
-                                ),
-                                height=400,  # Make the graph narrow and tall
-                                margin=dict(l=10, r=10, t=40, b=10),  # Reduce margins
-                                showlegend=False,  # Don't show legend
-                                yaxis=dict(
-                                    autorange='reversed',  # Reverse the Y-axis to increase depth downward
-                                    title=dict(
-                                        font=dict(size=8)  # Set a smaller font size for the y-axis label
-                                    )
-                                ),
-                                xaxis=dict(
-                                    title=dict(
-                                        font=dict(size=8)  # Set a smaller font size for the x-axis label
-                                    ),
-                                    range=[0, 100]  # Set the x-axis range to be from 0 to 100 (percentage)
+                if layout == "Single figure":
+                    if valid_fossils:
+                        fig = cached_figure(
+                            station_profiles_figure, level_version(level), selected_reference, selected_station, level
+                        )
+                        with timed("serialize", "depth profiles"):
+                            st.plotly_chart(fig, use_container_width=True)
+                else:
+                    # Create rows of columns for displaying graphs
+                    num_graphs_per_row = 4
+                    rows = (len(valid_fossils) + num_graphs_per_row - 1) // num_graphs_per_row  # Calculate number of rows needed
+
+                    # Loop through rows and create columns for each
+                    for row_idx in range(rows):
+                        # Create the columns for this row (up to 4 per row)
+                        columns = st.columns(num_graphs_per_row)
+
+                        # Loop through fossils and plot them
+                        for i in range(num_graphs_per_row):
+                            fossil_index = row_idx * num_graphs_per_row + i
+                            if fossil_index < len(valid_fossils):
+                                fossil = valid_fossils[fossil_index]
+                                fig = cached_figure(
+                                    taxon_profile_figure, level_version(level), selected_reference, selected_station,
+                                    level, fossil
                                 )
-                            )
-
 
                                 # Display the graph in the respective column
-                                with columns[i]:
+                                with columns[i], timed("serialize", "depth profile of a taxon"):
                                     st.plotly_chart(fig, use_container_width=True)
 
-     
+            # Compare what the two layouts send to the browser
+            if valid_fossils and st.checkbox("Compare payload size and build time of the layouts", key="depth_analysis_compare"):
+                st.table(compare_layouts(profiles, profiles_by_fossil))
+
+
+# Line graph of the depth profile of one taxon
+def depth_profile_figure(fossil, fossil_data):
+    # Normalized and sorted by depth in depth_profiles()
+    fig = px.line(
+        fossil_data,
+        x='Relative Abundance',  # Relative Abundance on the X-axis
+        y='Depth_in_core',       # Depth_in_core on the Y-axis
+        title=fossil,
+        labels={'Relative Abundance': 'Relative Abundance (%)', 'Depth_in_core': 'Depth in Core'},
+        line_shape='linear')  # Line graph
+
+    # Set a fixed x-axis range from 0 to 100 (percentage scale)
+    fig.update_layout(
+        title=dict(
+            text=fossil,
+            font=dict(size=10),  # Set a smaller font size for the title
+            x=0.5,
+            xanchor='center',
+            yanchor='top',
+        ),
+        height=400,  # Make the graph narrow and tall
+        margin=dict(l=10, r=10, t=40, b=10),  # Reduce margins
+        showlegend=False,  # Don't show legend
+        yaxis=dict(
+            autorange='reversed',  # Reverse the Y-axis to increase depth downward
+            title=dict(
+                font=dict(size=8)  # Set a smaller font size for the y-axis label
+            )
+        ),
+        xaxis=dict(
+            title=dict(
+                font=dict(size=8)  # Set a smaller font size for the x-axis label
+            ),
+            range=[0, 100]  # Set the x-axis range to be from 0 to 100 (percentage)
+        )
+    )
+    return fig
+
+
+# Small multiples of the depth profiles of all taxa in one figure, one panel per
+# taxon, all panels sharing the same (reversed) depth axis
+def depth_profiles_figure(profiles, num_graphs_per_row=4):
+    groups = profiles.groupby('Taxon', sort=False)
+    taxa = list(groups.groups)
+    rows = (len(taxa) + num_graphs_per_row - 1) // num_graphs_per_row
+    height = 350 * rows
+
+    fig = make_subplots(
+        rows=rows,
+        cols=num_graphs_per_row,
+        shared_yaxes='all',
+        subplot_titles=taxa,
+        vertical_spacing=min(0.1, 70 / height),  # About 70 px between the rows of panels
+        horizontal_spacing=0.04,
+        x_title='Relative Abundance (%)',
+        y_title='Depth in Core',
+    )
+
+    # One line per taxon, added in a single call
+    traces = [
+        go.Scatter(
+            x=fossil_data['Relative Abundance'].to_numpy(),
+            y=fossil_data['Depth_in_core'].to_numpy(),
+            mode='lines',
+            name=fossil,
+            line=dict(color='#636efa'),
+        )
+        for fossil, fossil_data in groups
+    ]
+    fig.add_traces(
+        traces,
+        rows=[k // num_graphs_per_row + 1 for k in range(len(taxa))],
+        cols=[k % num_graphs_per_row + 1 for k in range(len(taxa))],
+    )
 
-def add_footer():
-    st.markdown("""
-    <div style="text-align: center; font-size: 10px; margin-top: 30px;">
-        <a href="https://github.com/isik-hilal" target="_blank">GitHub</a> | 
-        <a href="https://www.linkedin.com/in/hilal-isik/" target="_blank">LinkedIn</a><br>
-        <span style="font-size: 8px;">Hilal Işık</span>
-    </div>
-    """, unsafe_allow_html=True)
+    fig.update_annotations(font=dict(size=10))  # Smaller panel titles
+    fig.update_yaxes(autorange='reversed')  # Depth increases downward
+    fig.update_xaxes(range=[0, 100], showticklabels=True)  # Percentage scale on every panel
+    fig.update_layout(height=height, margin=dict(l=60, r=10, t=40, b=60), showlegend=False)
+    return fig
+
+
+# Cached builders of the depth profile figures of a station
+def station_profiles_figure(reference, station, level):
+    return depth_profiles_figure(depth_profiles(reference, station, level))
+
+
+def taxon_profile_figure(reference, station, level, fossil):
+    profiles = depth_profiles(reference, station, level)
+    return depth_profile_figure(fossil, profiles[profiles['Taxon'] == fossil])
+
+
+# Number of figures, payload size and server-side build + serialization time of
+# the two layouts of the depth profiles
+def compare_layouts(profiles, profiles_by_fossil):
+    results = []
+    for layout in ["Single figure", "One graph per taxon"]:
+        start = time.perf_counter()
+        if layout == "Single figure":
+            figures = [depth_profiles_figure(profiles)]
+        else:
+            figures = [depth_profile_figure(fossil, data) for fossil, data in profiles_by_fossil.items()]
+        payload = sum(len(fig.to_json()) for fig in figures)
+        results.append({
+            "Layout": layout,
+            "Figures": len(figures),
+            "Payload (KB)": round(payload / 1024, 1),
+            "Build + serialize (ms)": round((time.perf_counter() - start) * 1000, 1),
+        })
+    return pd.DataFrame(results)
+
+
+# Labels and row positions of the samples ("Reference | Station | depth cm") or of
+# the stations ("Reference | Station") that can be compared
+def comparison_options(mode):
+    rows = load_sample_index()["rows"]
+    keys = [key for key in rows if len(key) == (3 if mode == "Samples" else 2)]
+    if mode == "Samples":
+        labels = [f"{reference} | {station} | {depth:g} cm" for reference, station, depth in keys]
+    else:
+        labels = [f"{reference} | {station}" for reference, station in keys]
+    return labels, [rows[key] for key in keys]
+
+
+# Mean abundances of the selected samples or stations (one row each, in the order of
+# the selection), from one grouped aggregation over all their samples
+def comparison_table(level, mode, selection):
+    labels, positions = cached_result(comparison_options, samples_version(), mode)
+    lookup = dict(zip(labels, positions))
+    parts = [lookup[label] for label in selection]
+    rows = np.concatenate(parts)
+    groups = np.repeat(np.arange(len(parts)), [len(part) for part in parts])
+    return group_means(level_abundance(level), rows, groups, len(parts), index=list(selection))
+
+
+# Stacked bars of the `top` most abundant taxa of the selection, the others summed as 'Others'
+def comparison_figure(level, mode, selection, top):
+    table = bucket_others(cached_result(comparison_table, level_version(level), level, mode, selection), top=top)
+    bars = table.rename_axis('Selection').reset_index().melt(
+        id_vars='Selection', var_name='Taxon', value_name='Relative Abundance'
+    )
+    fig = px.bar(
+        bars,
+        x='Selection',
+        y='Relative Abundance',
+        color='Taxon',
+        labels={'Relative Abundance': 'Relative Abundance (%)', 'Selection': ''},
+        color_discrete_map={'Others': 'lightgray'},
+        height=600,
+    )
+    fig.update_layout(barmode='stack', legend=dict(font=dict(size=10)), margin=dict(l=10, r=10, t=30, b=10))
+    return fig
+
+
+#third part with the comparison of several samples or stations
+def show_sample_comparison():
+    st.markdown(
+        """
+        <h2 style=" font-size: 25px;">3-Comparison of Samples and Stations</h2>
+        """, unsafe_allow_html=True
+    )
+    st.markdown(""" <div style="text-align: justify; font-size: 14px;">
+        Choose several samples, or whole stations (the mean of their samples), to compare their assemblages side by side.
+        </div>""", unsafe_allow_html=True
+    )
+
+    col1, col2 = st.columns(2)
+    with col1:
+        mode = st.radio("Compare:", ["Samples", "Stations"], horizontal=True, key="comparison_mode")
+    with col2:
+        level = st.radio("Taxonomic level:", LEVELS, horizontal=True, key="comparison_level")
+    labels, _ = cached_result(comparison_options, samples_version(), mode)
+    selection = tuple(st.multiselect(f"{mode}:", labels, key=f"comparison_{mode.lower()}"))
+    if not selection:
+        st.write("Choose samples or stations to compare.")
+        return
+    top = st.slider("Number of taxa shown:", 1, 30, 10, key="comparison_top")
+
+    # Stacked bars, computed for all the selection at once
+    fig = cached_figure(comparison_figure, level_version(level), level, mode, selection, top)
+    with timed("serialize", "comparison bars"):
+        st.plotly_chart(fig, use_container_width=True)
+
+    # Every taxon of the selection, with the difference between the selected items
+    with timed("filter", "comparison table"):
+        table = cached_result(comparison_table, level_version(level), level, mode, selection).T.copy()
+        if len(selection) == 2:
+            column = "Difference (%)"
+            table[column] = table[selection[1]] - table[selection[0]]
+        else:
+            column = "Range (%)"
+            table[column] = table.max(axis=1) - table.min(axis=1)
+        table = table.iloc[np.argsort(-table[column].abs().to_numpy(), kind='stable')]
+    st.markdown(
+        f"<p style='font-size: 14px;'>Relative abundances (%) of the {len(table)} taxa found in the selection, "
+        f"sorted by {'the difference between the two' if len(selection) == 2 else 'their range over the selection'}.</p>",
+        unsafe_allow_html=True
+    )
+    st.dataframe(table.rename_axis('Taxon').style.format(precision=2))
@@ -1,58 +1,83 @@
+import time
+from profiling import load_module, render_page, show_profile_panel, show_startup_report
 import streamlit as st
-from home import show_home
-from maps import create_first_map, create_second_map
-from analysis import show_analysis, show_depth_analysis, add_footer
-from references import show_references
-from cluster import show_clustermap
+from diagnostics import show_diagnostics_panel
 
 # Main application entry point
 def main():
-    # Sidebar navigation
+    run_start = time.perf_counter()
+
+    # Sidebar navigation. Page modules are imported the first time their page is
+    # shown, so a visit to Home does not load plotly and the data.
     st.sidebar.title("Navigation")
     pages = {
-        "Home": show_home,
+        "Home": show_home_section,
         "Maps": show_maps_section,
         "Single View": show_analysis_section,
+        "Taxon Search": show_search_section,
         "Similarity of Sites": show_cluster_section,
-        "References": show_references,
+        "References": show_references_section,
     }
-    selected_page = st.sidebar.radio("Go to", list(pages.keys()))
+    selected_page = st.sidebar.radio("Go to", list(pages.keys()), key="page")
 
     # Render the selected page
-    pages[selected_page]()
+    render_page(selected_page, pages[selected_page], run_start)
+    show_startup_report()
+    show_profile_panel()
+    show_diagnostics_panel()
 
 
+# Home section handler
+def show_home_section():
+    load_module("home").show_home()
 
 # Maps section handler
 def show_maps_section():
-    
+    maps = load_module("maps")
+    footer = load_module("footer")
+
     st.subheader("General Map Showing All Data Points")
-    create_first_map()
+    maps.create_first_map()
 
     st.subheader("Filtered Map by Reference")
-    create_second_map()
+    maps.create_second_map()
+
+    st.subheader("Stations in an Area")
+    maps.create_area_selection()
 
     # Add footer to the Maps section
-    add_footer()
+    footer.add_footer()
 
 # Analysis section handler (includes multiple analyses)
 def show_analysis_section():
+    analysis = load_module("analysis")
+    footer = load_module("footer")
+
+    analysis.show_analysis()
 
-    show_analysis()
-    
-    show_depth_analysis()
+    analysis.show_depth_analysis()
+
+    analysis.show_sample_comparison()
 
     # Add footer to the Maps section
     #empty spaces
     st.markdown("<br><br>", unsafe_allow_html=True)
     st.write("------")
-    add_footer()
+    footer.add_footer()
+
+# Taxon search section handler
+def show_search_section():
+    load_module("search").show_taxon_search()
 
 # clustering
 def show_cluster_section():
     #show the
 
-    show_clustermap()
+    load_module("cluster").show_clustermap()
+
+# References section handler
+def show_references_section():
+    load_module("references").show_references()
 
 
 
@@ -0,0 +1,118 @@
+import base64
+import io
+import json
+import os
+import streamlit as st
+from PIL import Image
+from files import BUILD_DIR, file_hash, file_stamp
+
+# Web variants of the images of the app: each source image is resized to the size
+# it is shown at and compressed. `python build.py images` writes them to
+# data/build/images/; a missing or outdated variant is encoded on first use. The
+# encoded variants are kept in a process-wide cache and shown with st.image in the
+# format and width they are stored in, so Streamlit serves them as they are from a
+# media URL the browser caches, without decoding or re-encoding them per rerun.
+
+IMAGES_DIR = "images"
+ASSETS_DIR = os.path.join(BUILD_DIR, "images")
+ASSETS_MANIFEST_PATH = os.path.join(ASSETS_DIR, "manifest.json")
+
+# Variants: name -> (source file in images/, width in pixels, format, quality).
+# st.image passes JPEG files through unchanged (WebP would be re-encoded), so the
+# images shown with it are JPEG; the zoomable dendrogram is drawn by plotly and
+# stays WebP.
+VARIANTS = {
+    "gamze_tanik": ("gamze_tanik.jpg", 100, "JPEG", 85),
+    "metu_logo": ("metu_logo.jpeg", 100, "JPEG", 85),
+    "cluster": ("cluster.png", 1400, "JPEG", 80),  # Published dendrogram, page width
+    "cluster_zoom": ("cluster.png", 2800, "WEBP", 80),  # Published dendrogram, zoomable on demand
+}
+
+EXTENSIONS = {"JPEG": "jpg", "WEBP": "webp"}
+
+
+def variant_path(name):
+    return os.path.join(ASSETS_DIR, f"{name}.{EXTENSIONS[VARIANTS[name][2]]}")
+
+
+def read_assets_manifest():
+    try:
+        with open(ASSETS_MANIFEST_PATH, encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def encode_variant(name):
+    source, width, image_format, quality = VARIANTS[name]
+    with Image.open(os.path.join(IMAGES_DIR, source)) as image:
+        if image.width > width:
+            image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        buffer = io.BytesIO()
+        if image_format == "JPEG":
+            image.convert("RGB").save(buffer, "JPEG", quality=quality, optimize=True)
+        else:
+            image.save(buffer, image_format, quality=quality, method=6)
+    return buffer.getvalue()
+
+
+# Write every variant and a manifest of their sources. Returns the manifest.
+def build_images():
+    os.makedirs(ASSETS_DIR, exist_ok=True)
+    manifest = {}
+    for name, (source, width, image_format, quality) in VARIANTS.items():
+        content = encode_variant(name)
+        with open(variant_path(name), "wb") as file:
+            file.write(content)
+        with Image.open(io.BytesIO(content)) as image:
+            size = image.size
+        manifest[name] = {
+            "source": source,
+            "format": image_format,
+            "sha256": file_hash(os.path.join(IMAGES_DIR, source)),
+            "width": size[0],
+            "height": size[1],
+            "bytes": len(content),
+            "source_bytes": os.path.getsize(os.path.join(IMAGES_DIR, source)),
+        }
+    with open(ASSETS_MANIFEST_PATH, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
+    return manifest
+
+
+@st.cache_resource(max_entries=len(VARIANTS), show_spinner=False)
+def _load_variant(name, stamp):
+    source = os.path.join(IMAGES_DIR, VARIANTS[name][0])
+    entry = read_assets_manifest().get(name)
+    if (entry and entry.get("format") == VARIANTS[name][2] and os.path.exists(variant_path(name))
+            and entry["sha256"] == file_hash(source)):
+        with open(variant_path(name), "rb") as file:
+            content = file.read()
+    else:
+        content = encode_variant(name)
+    with Image.open(io.BytesIO(content)) as image:
+        size = image.size
+    return {"data": content, "size": size, "format": VARIANTS[name][2]}
+
+
+# Version of the source of a variant, for the cache keys of results derived from it
+def image_version(name):
+    return file_stamp(os.path.join(IMAGES_DIR, VARIANTS[name][0]))
+
+
+# Variant of an image: {"data": encoded bytes, "size": (width, height), "format"}
+def load_variant(name):
+    return _load_variant(name, image_version(name))
+
+
+# Data URI of a variant, for the figures that embed an image
+def image_uri(name):
+    variant = load_variant(name)
+    return f"data:image/{variant['format'].lower()};base64," + base64.b64encode(variant["data"]).decode("ascii")
+
+
+# Show a variant at its own width, or at the page width. The width and format match the stored file, so st.image sends it as it is.
+def show_image(name, caption=None, use_column_width=False):
+    variant = load_variant(name)
+    st.image(variant["data"], caption=caption, width=variant["size"][0], use_column_width=use_column_width,
+             output_format=variant["format"])
@@ -0,0 +1,147 @@
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tracemalloc
+from datetime import datetime, timezone
+
+import streamlit
+from caching import cache_stats
+from headless import APP_DIR, HeadlessRunner, apply_step, install_runtime
+
+# Headless benchmark of the app: every page of the `pages` dict in app.main() is
+# opened in a new session and driven through representative interactions with
+# Streamlit's script-runner testing API. Each rerun records its wall time, peak
+# memory (tracemalloc) and the number and size of the elements sent to the
+# browser. Results are written as JSON, so that two commits can be compared:
+#   python benchmark.py --output before.json
+#   python benchmark.py --output after.json --compare before.json
+
+# Scenarios: name -> (page, steps). A step is (widget type, label or key, value),
+# see headless.apply_step.
+SCENARIOS = {
+    "home": ("Home", []),
+    "maps": ("Maps", [
+        ("radio", "first_map_mode", "One per sample"),
+        ("selectbox", "first_map_color", "Shannon H'"),
+        ("selectbox", "Select a Reference", "Kırcı-Elmas 2006"),
+        ("selectbox", "Taxa:", 1),
+        ("radio", "Table view:", "Full table"),
+        ("selectbox", "Download format:", "Excel"),
+        ("slider", "area_lat", (40.6, 40.9)),
+        ("radio", "area_mode", "Polygon"),
+    ]),
+    "single_view": ("Single View", [
+        ("selectbox", "Choose a Reference:", "Kırcı-Elmas 2006"),
+        ("selectbox", "Choose a Station:", 1),
+        ("selectbox", "Choose a Depth in Core (Sample):", 1),
+        ("selectbox", "similar_samples_metric", "Jaccard"),
+        ("radio", "single_view_level", "Genus"),
+        ("selectbox", "depth_analysis_reference", "This study"),
+        ("selectbox", "depth_analysis_station", 1),
+        ("radio", "depth_analysis_layout", "One graph per taxon"),
+        ("radio", "depth_analysis_level", "Genus"),
+        ("multiselect", "comparison_samples", 0),
+        ("multiselect", "comparison_samples", 1),
+        ("radio", "comparison_mode", "Stations"),
+        ("multiselect", "comparison_stations", 0),
+        ("multiselect", "comparison_stations", 1),
+    ]),
+    "taxon_search": ("Taxon Search", [
+        ("radio", "taxon_search_level", "Genus"),
+        ("selectbox", "taxon_search_taxon", 5),
+        ("slider", "taxon_search_threshold", 10.0),
+        ("text_input", "taxon_search_name", "Pseudoeponides falsobeccarii"),
+    ]),
+    "similarity_of_sites": ("Similarity of Sites", [
+        ("slider", "live_cluster_similarity", 50),
+        ("multiselect", "Choose Clusters to display:", 1),
+        ("checkbox", "show_published_dendrogram", True),
+    ]),
+    "references": ("References", []),
+}
+
+
+# Run one scenario in a new session: open the app, go to the page and apply the
+# steps one rerun at a time
+def run_scenario(name, trace_memory):
+    page, steps = SCENARIOS[name]
+    tree, result = HeadlessRunner().run_once(trace_memory=trace_memory)
+    results = [{"step": "open app", **result}]
+    plan = [("radio", "Go to", page)] + steps
+    for kind, widget, value in plan:
+        widget_states = apply_step(tree, kind, widget, value)
+        tree, result = HeadlessRunner(tree.session_state).run_once(widget_states, trace_memory)
+        results.append({"step": f"{widget} = {value}", **result})
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Print the change in wall time of every rerun found in both result files
+def compare(results, baseline):
+    previous = {(run["pass"], run["scenario"], run["step"]): run for run in baseline["runs"]}
+    print(f"\nChange against {baseline.get('commit')}:")
+    for run in results["runs"]:
+        before = previous.get((run["pass"], run["scenario"], run["step"]))
+        if before and before["wall_ms"]:
+            change = (run["wall_ms"] - before["wall_ms"]) / before["wall_ms"] * 100
+            print(f"  pass {run['pass']} {run['scenario']:<20} {run['step'][:45]:<45} "
+                  f"{before['wall_ms']:8.1f} -> {run['wall_ms']:8.1f} ms ({change:+.0f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless benchmark of the app pages and interactions.")
+    parser.add_argument("--output", default="benchmark.json", help="JSON file to write the results to")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS),
+                        help="scenario to run (repeatable, all by default)")
+    parser.add_argument("--passes", type=int, default=2,
+                        help="times to run the scenarios; the first pass fills the process-wide caches")
+    parser.add_argument("--no-memory", action="store_true", help="do not trace memory (tracemalloc slows the app down)")
+    parser.add_argument("--compare", help="earlier result file to compare the wall times with")
+    args = parser.parse_args()
+
+    install_runtime()
+    trace_memory = not args.no_memory
+    if trace_memory:
+        tracemalloc.start()
+
+    runs = []
+    for number in range(1, args.passes + 1):
+        for name in args.scenario or SCENARIOS:
+            for result in run_scenario(name, trace_memory):
+                runs.append({"pass": number, "scenario": name, **result})
+                print(f"pass {number} {name:<20} {result['step'][:45]:<45} {result['wall_ms']:8.1f} ms "
+                      f"{result['elements']:4d} elements {result['bytes'] / 1024:8.1f} KB"
+                      + (f" {result['peak_memory_kb'] / 1024:7.1f} MB peak" if trace_memory else "")
+                      + (f"  EXCEPTIONS: {result['exceptions']}" if result["exceptions"] else ""))
+
+    results = {
+        "commit": git_commit(),
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "streamlit": streamlit.__version__,
+        "memory_traced": trace_memory,
+        "runs": runs,
+        "caches": cache_stats(),
+    }
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2, ensure_ascii=False)
+    print(f"Wrote {len(runs)} reruns to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            compare(results, json.load(file))
+    if any(run["exceptions"] for run in runs):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import argparse
+import assets
+import dataset
+import exports
+import ingest
+import snapshot
+
+
+# Convert the source files into columnar Parquet copies and report the load times
+def build_data(args):
+    timings = dataset.build_sidecars()
+    print(f"Wrote columnar copies and manifest to {dataset.BUILD_DIR}/")
+    for name, (source_seconds, sidecar_seconds) in timings.items():
+        speedup = source_seconds / sidecar_seconds if sidecar_seconds else float("inf")
+        print(
+            f"  {name:<12} source {source_seconds * 1000:8.1f} ms   "
+            f"parquet {sidecar_seconds * 1000:7.1f} ms   speed-up {speedup:.1f}x"
+        )
+
+
+# Write the per-reference exports and the data bundle for the current data
+def build_exports(args):
+    directory, manifest = exports.build_exports()
+    total = sum(entry["bytes"] for entry in manifest["files"].values())
+    print(f"Wrote {len(manifest['files'])} export files ({total / 1024 / 1024:.1f} MB) to {directory}/")
+
+
+# Write the resized variants of the images
+def build_images(args):
+    manifest = assets.build_images()
+    print(f"Wrote {len(manifest)} image variants to {assets.ASSETS_DIR}/")
+    for name, entry in manifest.items():
+        print(
+            f"  {name:<14} {entry['width']:>5} x {entry['height']:<5} "
+            f"{entry['bytes'] / 1024:7.1f} KB (source {entry['source_bytes'] / 1024:7.1f} KB)"
+        )
+
+
+# Render every page and every Single View sample to static HTML
+def build_snapshot(args):
+    manifest = snapshot.build_snapshot(args.output, args.limit)
+    total = sum(manifest["files"].values())
+    print(f"Wrote {len(manifest['files'])} pages ({total / 1024 / 1024:.1f} MB) to {args.output}/")
+
+
+# Add a study file to the data as a new partition
+def ingest_study(args):
+    try:
+        entry = ingest.ingest_study(args.file, replace=args.replace)
+    except ValueError as error:
+        print(f"{args.file} was not added:")
+        for problem in str(error).splitlines():
+            print(f"  - {problem}")
+        raise SystemExit(1)
+    print(f"Added {entry['reference']} ({entry['code']}): {entry['rows']} samples, {entry['stations']} stations, "
+          f"{entry['taxa']} taxa to {dataset.STUDIES_DIR}/{entry['file']}")
+    if entry["new_taxa"]:
+        print(f"  new taxa ({len(entry['new_taxa'])}): {', '.join(entry['new_taxa'])}")
+    if entry["unlisted_taxa"]:
+        print(f"  not in the taxa list ({dataset.TAXA_PATH}): {', '.join(entry['unlisted_taxa'])}")
+    print("Run `python build.py exports` to update the downloads.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build steps for the web app data.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    data_parser = commands.add_parser("data", help="convert the data files to columnar Parquet copies")
+    data_parser.set_defaults(func=build_data)
+
+    exports_parser = commands.add_parser("exports", help="write the per-reference downloads and the data bundle")
+    exports_parser.set_defaults(func=build_exports)
+
+    images_parser = commands.add_parser("images", help="write the resized variants of the images")
+    images_parser.set_defaults(func=build_images)
+
+    ingest_parser = commands.add_parser("ingest", help="validate a study file and add it to the data")
+    ingest_parser.add_argument("file", help="study file (.xlsx, .csv or .parquet) in the layout of the samples file")
+    ingest_parser.add_argument("--replace", action="store_true", help="update a study added before with the same Code")
+    ingest_parser.set_defaults(func=ingest_study)
+
+    snapshot_parser = commands.add_parser("snapshot", help="render the pages to static HTML for a file server or CDN")
+    snapshot_parser.add_argument("--output", default=snapshot.SITE_DIR, help="directory to write the site to")
+    snapshot_parser.add_argument("--limit", type=int, help="render only the first LIMIT Single View samples")
+    snapshot_parser.set_defaults(func=build_snapshot)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
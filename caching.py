@@ -0,0 +1,134 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from streamlit.vendor.pympler.asizeof import asizeof
+from profiling import timed
+
+# Caches shared by all sessions of the process. The datasets and the indexes built
+# from them are loaded once with st.cache_resource (dataset.py, similarity.py);
+# the results of a selection (figures, depth profiles, exports) are kept in the
+# size-bounded LRU caches below, so a result is built once per (builder, data
+# version, arguments) and reused on every rerun and by every session with the same
+# selection. Cached results are shared objects: never update them after they are
+# returned.
+
+# Memory limit of each cache in MB, set with the environment variables
+CACHE_LIMITS = {
+    "figures": float(os.environ.get("APP_FIGURE_CACHE_MB", "256")),
+    "results": float(os.environ.get("APP_RESULT_CACHE_MB", "128")),
+    "exports": float(os.environ.get("APP_EXPORT_CACHE_MB", "64")),
+}
+
+
+# Estimated memory of a cached value in bytes: exact for arrays, frames and bytes,
+# a deep size of the contents for the rest (a figure is measured as its dict)
+def memory_size(value):
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        return int(np.sum(value.memory_usage(deep=True)))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (bytes, str)):
+        return sys.getsizeof(value)
+    if hasattr(value, "to_plotly_json"):  # A plotly figure (plotly is not imported here)
+        return asizeof(value.to_dict())
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(memory_size(key) + memory_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(memory_size(item) for item in value)
+    return asizeof(value)
+
+
+# Process-wide LRU cache, bounded by the estimated memory of its entries: once the
+# total is over the limit, the least recently used entries are dropped. A value is
+# built once even when several sessions ask for it at the same time.
+class SharedCache:
+    def __init__(self, name, max_mb):
+        self.name = name
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.entries = OrderedDict()  # key -> (value, bytes), least recently used first
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+        self.lock = threading.Lock()
+        self.building = {}  # key -> lock held while the value is built
+
+    def _lookup(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True, self.entries[key][0]
+            return False, self.building.setdefault(key, threading.Lock())
+
+    def get(self, key, build):
+        found, result = self._lookup(key)
+        if found:
+            return result
+        with result:  # Waits for a build of the same key in another session
+            found, value = self._lookup(key)
+            if found:
+                return value
+            try:
+                value = build()
+                size = memory_size(value)
+                with self.lock:
+                    self.misses += 1
+                    if size <= self.max_bytes:  # Larger values are returned but not kept
+                        self.entries[key] = (value, size)
+                        self.bytes += size
+                        while self.bytes > self.max_bytes:
+                            _, (_, dropped) = self.entries.popitem(last=False)
+                            self.bytes -= dropped
+                            self.evictions += 1
+            finally:
+                with self.lock:
+                    self.building.pop(key, None)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            requests = self.hits + self.misses
+            return {
+                "Cache": self.name,
+                "Entries": len(self.entries),
+                "MB": round(self.bytes / 1024 ** 2, 2),
+                "Limit (MB)": round(self.max_bytes / 1024 ** 2),
+                "Hits": self.hits,
+                "Misses": self.misses,
+                "Hit rate": round(self.hits / requests, 3) if requests else None,
+                "Evictions": self.evictions,
+            }
+
+
+# The caches of the process, by name (module-level, so they outlive reruns and are
+# shared by the script threads of all sessions)
+CACHES = {name: SharedCache(name, max_mb) for name, max_mb in CACHE_LIMITS.items()}
+
+
+def _cache_key(build, version, args):
+    return (f"{build.__module__}.{build.__qualname__}", version, args)
+
+
+# Figure returned by build(*args), cached on the builder, the version of the data
+# it is built from and its (hashable) arguments
+def cached_figure(build, version, *args):
+    with timed("figure", build.__name__):
+        return CACHES["figures"].get(_cache_key(build, version, args), lambda: build(*args))
+
+
+# Any other result of a selection (a frame, arrays, bytes), cached like a figure in
+# the cache `cache`
+def cached_result(build, version, *args, cache="results"):
+    return CACHES[cache].get(_cache_key(build, version, args), lambda: build(*args))
+
+
+# Statistics of every cache, one dict per cache
+def cache_stats():
+    return [cache.stats() for cache in CACHES.values()]
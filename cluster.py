@@ -1,24 +1,38 @@
 import streamlit as st
-import pandas as pd
 import plotly.express as px
-from analysis import add_footer
-
-
-# Load the data
-def load_data():
-    data = pd.read_csv("data/cluster.csv")  # Loading CSV data
-    data.columns = data.columns.str.strip() 
-    data = data.sort_values(by='Cluster/Subcluster', ascending=True)
-    data['Cluster/Subcluster'] = data['Cluster/Subcluster'].astype('object') # Strip any leading/trailing spaces
-    return data
+import plotly.graph_objects as go
+from footer import add_footer
+from assets import image_uri, image_version, load_variant, show_image
+from caching import cached_figure
+from profiling import timed
+from dataset import clusters_version, load_clusters
+from similarity import CLUSTER_COLORS, clustered_samples, clustering_version, dendrogram_figure, load_surface_clustering
 
 # Function to show the map
 def show_clustermap():
     # Load the data
-    data = load_data()
+    data = load_clusters()
     # Title for the references section
     st.title("Similarity of Sites")
-    st.image("images/cluster.png", caption="Cluster Image") #use_container_width=True)
+
+    # Cluster analysis computed from the data, with an adjustable cut
+    show_live_clustering()
+
+    # Published cluster analysis
+    st.markdown(
+        """
+        <h2 style=" font-size: 25px;">Published Cluster Analysis</h2>
+        """ , unsafe_allow_html=True
+    )
+    # The published figure is large, only send it when asked for: a page-wide
+    # variant, or on demand a high-resolution one that can be zoomed into
+    if st.checkbox("Show the published dendrogram", key="show_published_dendrogram"):
+        if st.checkbox("Zoomable high-resolution version", key="zoom_published_dendrogram"):
+            fig = cached_figure(zoomable_image_figure, image_version("cluster_zoom"), "cluster_zoom")
+            st.plotly_chart(fig, use_container_width=True)
+        else:
+            show_image("cluster", use_column_width=True)
+        st.caption("Cluster Image")
 
     st.markdown("""
                 <p style="text-align:justify; font-size:14px;">
@@ -76,76 +90,173 @@ def show_clustermap():
             st.error("Latitude and Longitude columns are missing in the data.")
             return
 
-        # Get bounding box for dynamic zoom
-        lat_min, lat_max = filtered_data['Latitude'].min(), filtered_data['Latitude'].max()
-        lon_min, lon_max = filtered_data['Longitude'].min(), filtered_data['Longitude'].max()
-
-        # Calculate center of the map for better zooming (mean of latitudes and longitudes)
-        lat_center = (lat_min + lat_max) / 2
-        lon_center = (lon_min + lon_max) / 2
-
-        # Create a list of colors (15 colors for 15 clusters)
-        colors = [
-    "#1f77b4",  # Blue
-    "#8c564b",  # Brown
-    "#d49a6a",  # Light Brown
-    "#b5634f",  # Burnt Orange
-    "#bcbd22",  # Yellow-green
-    "#e377c2",  # Pink
-    "#7f7f7f",  # Gray
-    "#8e44ad",  # Purple
-    "#f1c40f",  # Gold
-    "#ba55d3",  # Lavender
-    "#ff7f0e",  # Bright Orange
-    "#2ca02c",  # Green
-    "#ffbb78",  # Peach
-    "#17becf",  # Cyan
-    "#9b59b6",  # Amethyst
-    "#ff6347",  # Tomato Red
-    "#4682b4",  # Steel Blue
-    "#32cd32",  # Lime Green
-]
-
-        # Ensure that clusters have unique colors by using color_discrete_map
-        color_map = {cluster: colors[i] for i, cluster in enumerate(unique_clusters)}
-
-        # Create a map with points for the selected clusters
-        fig = px.scatter_mapbox(
-            filtered_data,
-            lat='Latitude',  # Latitude column
-            lon='Longitude',  # Longitude column
-            color='Cluster/Subcluster',  # Cluster column for different colors
-            hover_name='Reference',  # Hover name (can show more info in hover)
-            hover_data={
-                'Reference': False,
-                'Station': True,
-                'Details':True,
-                'Latitude': False,
-                'Longitude': False
-            },
-            color_discrete_map=color_map,  # Use the custom color map
-            mapbox_style="open-street-map",  # Map style
-            zoom=7,  # Zoom level (will be overwritten dynamically)
-            center={"lat": lat_center, "lon": lon_center},  # Center the map dynamically
-            height=600
-        )
-
-        fig.update_traces(marker=dict(opacity=0.7, size=10))
-
-        # Update the map zoom to ensure the points are visible
-        fig.update_layout(
-            mapbox=dict(
-                bearing=0,
-                pitch=0,
-                zoom=7,  # Can adjust this further depending on the spread of the points
-                center={"lat": lat_center, "lon": lon_center}
-            )
-        )
+        # Map of the selected clusters, cached per selection
+        fig = cached_figure(cluster_map_figure, clusters_version(), tuple(selected_clusters))
 
         # Show the map
-        st.plotly_chart(fig)
+        with timed("serialize", "published cluster map"):
+            st.plotly_chart(fig)
 
     # Empty spaces
     st.markdown("<br><br>", unsafe_allow_html=True)
     st.write("------")
     add_footer()
+
+
+# Cluster analysis computed in the app from the surface samples of all stations
+def show_live_clustering():
+    st.markdown(
+        """
+        <h2 style=" font-size: 25px;">Live Cluster Analysis</h2>
+        <p style="text-align:justify; font-size:14px;">
+        Hierarchical clustering (UPGMA, Bray-Curtis) of the surface sample of every station, computed from the
+        relative abundances in the data set. Move the slider to cut the dendrogram at another similarity level;
+        the clusters and the map below are updated without recomputing the distances.
+        </p>
+        """ , unsafe_allow_html=True
+    )
+
+    with timed("load", "surface clustering"):
+        clustering = load_surface_clustering()
+    cut_similarity = st.slider("Cut the dendrogram at similarity (%):", 0, 100, 32, key="live_cluster_similarity")
+    with timed("filter", "clusters at the cut"):
+        samples = clustered_samples(clustering, cut_similarity)
+
+    st.write(f"**{len(samples['Cluster'].cat.categories)} clusters** of **{len(samples)} stations** "
+             f"at {cut_similarity}% similarity.")
+    version = clustering_version()
+    fig = cached_figure(live_dendrogram_figure, version, cut_similarity)
+    with timed("serialize", "live dendrogram"):
+        st.plotly_chart(fig, use_container_width=True)
+
+    # Map of the stations colored by their computed cluster
+    fig = cached_figure(live_cluster_map_figure, version, cut_similarity)
+    with timed("serialize", "live cluster map"):
+        st.plotly_chart(fig)
+
+
+# Dendrogram of the live cluster analysis cut at a similarity (%)
+def live_dendrogram_figure(cut_similarity):
+    return dendrogram_figure(load_surface_clustering(), cut_similarity)
+
+
+# Map of the stations colored by their cluster in the live cluster analysis
+def live_cluster_map_figure(cut_similarity):
+    samples = clustered_samples(load_surface_clustering(), cut_similarity)
+    color_map = {
+        cluster: CLUSTER_COLORS[i % len(CLUSTER_COLORS)]
+        for i, cluster in enumerate(samples['Cluster'].cat.categories)
+    }
+    fig = px.scatter_mapbox(
+        samples,
+        lat='Lat',
+        lon='Long',
+        color='Cluster',
+        hover_name='Label',
+        hover_data={
+            'Reference': True,
+            'Station': True,
+            'Water_depth': True,
+            'Cluster': True,
+            'Lat': False,
+            'Long': False,
+        },
+        category_orders={'Cluster': list(samples['Cluster'].cat.categories)},
+        color_discrete_map=color_map,
+        mapbox_style="open-street-map",
+        zoom=7,
+        center={"lat": 40.8, "lon": 28.5},
+        height=600
+    )
+    fig.update_traces(marker=dict(opacity=0.7, size=10))
+    fig.update_layout(margin={"r": 0, "t": 0, "l": 0, "b": 0})
+    return fig
+
+
+# Map of the published clusters/subclusters selected by the user
+def cluster_map_figure(selected_clusters):
+    data = load_clusters()
+    unique_clusters = data['Cluster/Subcluster'].dropna().unique()
+    filtered_data = data[data['Cluster/Subcluster'].isin(selected_clusters)]
+
+    # Get bounding box for dynamic zoom
+    lat_min, lat_max = filtered_data['Latitude'].min(), filtered_data['Latitude'].max()
+    lon_min, lon_max = filtered_data['Longitude'].min(), filtered_data['Longitude'].max()
+
+    # Calculate center of the map for better zooming (mean of latitudes and longitudes)
+    lat_center = (lat_min + lat_max) / 2
+    lon_center = (lon_min + lon_max) / 2
+
+    # Create a list of colors (15 colors for 15 clusters)
+    colors = [
+"#1f77b4",  # Blue
+"#8c564b",  # Brown
+"#d49a6a",  # Light Brown
+"#b5634f",  # Burnt Orange
+"#bcbd22",  # Yellow-green
+"#e377c2",  # Pink
+"#7f7f7f",  # Gray
+"#8e44ad",  # Purple
+"#f1c40f",  # Gold
+"#ba55d3",  # Lavender
+"#ff7f0e",  # Bright Orange
+"#2ca02c",  # Green
+"#ffbb78",  # Peach
+"#17becf",  # Cyan
+"#9b59b6",  # Amethyst
+"#ff6347",  # Tomato Red
+"#4682b4",  # Steel Blue
+"#32cd32",  # Lime Green
+]
+
+    # Ensure that clusters have unique colors by using color_discrete_map
+    color_map = {cluster: colors[i] for i, cluster in enumerate(unique_clusters)}
+
+    # Create a map with points for the selected clusters
+    fig = px.scatter_mapbox(
+        filtered_data,
+        lat='Latitude',  # Latitude column
+        lon='Longitude',  # Longitude column
+        color='Cluster/Subcluster',  # Cluster column for different colors
+        hover_name='Reference',  # Hover name (can show more info in hover)
+        hover_data={
+            'Reference': False,
+            'Station': True,
+            'Details':True,
+            'Latitude': False,
+            'Longitude': False
+        },
+        color_discrete_map=color_map,  # Use the custom color map
+        mapbox_style="open-street-map",  # Map style
+        zoom=7,  # Zoom level (will be overwritten dynamically)
+        center={"lat": lat_center, "lon": lon_center},  # Center the map dynamically
+        height=600
+    )
+
+    fig.update_traces(marker=dict(opacity=0.7, size=10))
+
+    # Update the map zoom to ensure the points are visible
+    fig.update_layout(
+        mapbox=dict(
+            bearing=0,
+            pitch=0,
+            zoom=7,  # Can adjust this further depending on the spread of the points
+            center={"lat": lat_center, "lon": lon_center}
+        )
+    )
+    return fig
+
+
+# Zoomable figure of a variant: drag to zoom in, double-click to zoom out
+def zoomable_image_figure(name):
+    variant = load_variant(name)
+    width, height = variant["size"]
+    fig = go.Figure(go.Image(source=image_uri(name)))
+    fig.update_layout(
+        height=round(900 * min(1.5, height / width)),
+        margin=dict(l=0, r=0, t=0, b=0),
+        xaxis=dict(visible=False),
+        yaxis=dict(visible=False),
+        dragmode="zoom",
+    )
+    return fig
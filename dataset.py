@@ -0,0 +1,324 @@
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+import streamlit as st
+from abundance import build_abundance, merge_abundance
+from diversity import diversity_indices
+from files import BUILD_DIR, DATA_DIR, file_hash, file_stamp
+from profiling import timed
+from schema import drop_unused_categories, taxon_columns, typed_metadata
+
+# Source files of the app
+SAMPLES_PATH = os.path.join(DATA_DIR, "gamze2.xlsx")
+CLUSTERS_PATH = os.path.join(DATA_DIR, "cluster.csv")
+REFERENCES_PATH = os.path.join(DATA_DIR, "references.csv")
+TAXA_PATH = os.path.join(DATA_DIR, "taxa.xlsx")
+
+# Columnar copies of the source files written by `python build.py data`
+MANIFEST_PATH = os.path.join(BUILD_DIR, "manifest.json")
+
+# Studies added with `python build.py ingest` (see ingest.py): one Parquet
+# partition per study, listed in ingestion order in the studies manifest. The
+# samples of the app are the samples file followed by these partitions.
+STUDIES_DIR = os.path.join(DATA_DIR, "studies")
+STUDIES_MANIFEST_PATH = os.path.join(STUDIES_DIR, "manifest.json")
+
+
+# The frames returned by the load_* functions below are loaded once per process
+# and shared by every session and every page. They must be treated as read-only:
+# filter or copy them, never modify them in place.
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def _source_hash(path, stamp):
+    return file_hash(path)
+
+
+# Content hash of the source file of a dataset, computed once per version of the file
+def source_hash(name):
+    path = SOURCES[name][0]
+    return _source_hash(path, file_stamp(path))
+
+
+# Readers of the original source files. They also give every column a single
+# type, so that the frames can be stored in Parquet and look the same whether
+# they come from the source file or from its columnar copy.
+
+# Version of the readers, recorded with every columnar copy. Bump it whenever a
+# reader changes the frame it returns, so that the copies written by the older
+# code are read again from the source files instead of being served stale.
+READER_VERSION = 1
+
+def _samples_from_source(path):
+    data = pd.read_excel(path, engine="openpyxl")
+    # Drop unnamed helper columns (e.g. the row total in 'Unnamed: 450')
+    data = data.loc[:, ~data.columns.str.contains('^Unnamed')]
+    # Text columns mix strings and numbers (Station names, "-" for missing TOC/N)
+    text_columns = data.columns[data.dtypes == object]
+    return data.astype({col: "string" for col in text_columns})
+
+
+def _clusters_from_source(path):
+    data = pd.read_csv(path)
+    data.columns = data.columns.str.strip()  # Strip any leading/trailing spaces
+    data = data.sort_values(by='Cluster/Subcluster', ascending=True)
+    data['Cluster/Subcluster'] = data['Cluster/Subcluster'].astype('object')
+    return data
+
+
+def _references_from_source(path):
+    return pd.read_csv(path)
+
+
+def _taxa_from_source(path):
+    return pd.read_excel(path, engine="openpyxl")
+
+
+# Name of each dataset -> (source file, reader of the source file)
+SOURCES = {
+    "samples": (SAMPLES_PATH, _samples_from_source),
+    "clusters": (CLUSTERS_PATH, _clusters_from_source),
+    "references": (REFERENCES_PATH, _references_from_source),
+    "taxa": (TAXA_PATH, _taxa_from_source),
+}
+
+
+def sidecar_path(name):
+    return os.path.join(BUILD_DIR, f"{name}.parquet")
+
+
+def read_manifest():
+    try:
+        with open(MANIFEST_PATH, encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+# Read a dataset from its columnar copy when the manifest says it was built from
+# the current source file by the current readers, otherwise parse the source file itself
+def read_dataset(name):
+    path, reader = SOURCES[name]
+    entry = read_manifest().get(name)
+    if (entry and os.path.exists(sidecar_path(name)) and entry.get("reader_version") == READER_VERSION
+            and entry["sha256"] == file_hash(path)):
+        try:
+            with timed("load", f"read {name} from parquet"):
+                return pd.read_parquet(sidecar_path(name))
+        except Exception:
+            pass  # Unreadable copy, fall back to the source file
+    with timed("load", f"read {name} from {os.path.basename(path)}"):
+        return reader(path)
+
+
+# Studies added to the samples file, in ingestion order: a list of manifest entries
+# ({"code", "reference", "file", "sha256", ...})
+def read_studies():
+    try:
+        with open(STUDIES_MANIFEST_PATH, encoding="utf-8") as file:
+            return json.load(file)["studies"]
+    except (OSError, ValueError, KeyError):
+        return []
+
+
+def study_path(entry):
+    return os.path.join(STUDIES_DIR, entry["file"])
+
+
+# Hash of the list of added studies ("" when there is none)
+def studies_hash():
+    if not os.path.exists(STUDIES_MANIFEST_PATH):
+        return ""
+    return _source_hash(STUDIES_MANIFEST_PATH, file_stamp(STUDIES_MANIFEST_PATH))
+
+
+# Write the columnar copy of every dataset and the manifest of source hashes and
+# reader versions.
+# Returns the load times of the source and of the copy for each dataset.
+def build_sidecars():
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    manifest, timings = {}, {}
+    for name, (path, reader) in SOURCES.items():
+        start = time.perf_counter()
+        data = reader(path)
+        source_seconds = time.perf_counter() - start
+
+        data.to_parquet(sidecar_path(name))
+        start = time.perf_counter()
+        pd.read_parquet(sidecar_path(name))
+        sidecar_seconds = time.perf_counter() - start
+
+        manifest[name] = {
+            "source": os.path.basename(path),
+            "sha256": file_hash(path),
+            "reader_version": READER_VERSION,
+            "sidecar": os.path.basename(sidecar_path(name)),
+            "rows": len(data),
+            "columns": len(data.columns),
+        }
+        timings[name] = (source_seconds, sidecar_seconds)
+
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
+    return timings
+
+
+# Levels of the Reference -> Station -> Depth selectors of the Single View
+SAMPLE_LEVELS = ['Reference', 'Station', 'Depth_in_core']
+
+
+# Index of the sample hierarchy of a metadata frame: "options" maps a key prefix,
+# e.g. () or (reference, station), to the values of the next level in order of
+# first appearance (like .dropna().unique()), and "rows" maps every prefix to the
+# positions of its rows in the frame and in the abundance matrix.
+def index_samples(data):
+    options, rows = {}, {(): np.arange(len(data))}
+    for depth in range(1, len(SAMPLE_LEVELS) + 1):
+        groups = data.groupby(SAMPLE_LEVELS[:depth], sort=False, observed=True).indices
+        # Order the groups by their first row, as .unique() would
+        for key, positions in sorted(groups.items(), key=lambda item: item[1][0]):
+            key = key if isinstance(key, tuple) else (key,)
+            rows[key] = positions
+            options.setdefault(key[:-1], []).append(key[-1])
+    return {"options": options, "rows": rows}
+
+
+# Index of the samples of several parts stacked in order: the rows of each part
+# are shifted by the number of rows before it
+def merge_indexes(indexes, sizes):
+    options, rows = {}, {}
+    offset = 0
+    for index, size in zip(indexes, sizes):
+        for key, values in index["options"].items():
+            merged = options.setdefault(key, [])
+            known = set(merged)
+            merged.extend(value for value in values if value not in known)
+        for key, positions in index["rows"].items():
+            positions = positions + offset
+            rows[key] = np.concatenate([rows[key], positions]) if key in rows else positions
+        offset += size
+    return {"options": options, "rows": rows}
+
+
+# Split a samples frame into a small metadata frame with the types of the schema
+# (see schema.py), the sparse abundances of its taxa (see abundance.py), the
+# diversity indices of its samples (see diversity.py) and the index of its samples;
+# the wide frame only exists while it is being split.
+def split_samples(data):
+    data = data.reset_index(drop=True)
+    metadata = typed_metadata(data)
+    abundance = build_abundance(data[taxon_columns(data.columns)])
+    return {
+        "metadata": metadata,
+        "abundance": abundance,
+        "diversity": diversity_indices(abundance, metadata["N"]),
+        "index": index_samples(metadata),
+    }
+
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def _read_samples_file(stamp):
+    return split_samples(read_dataset("samples"))
+
+
+# One entry per added study: a new study is read once, the others stay cached
+@st.cache_resource(max_entries=1024, show_spinner=False)
+def _read_study(path, sha256):
+    with timed("load", f"read study {os.path.basename(path)}"):
+        return split_samples(pd.read_parquet(path))
+
+
+# The samples file and the added studies, stacked in order. Only the parts whose
+# file changed are read again; the rest is a concatenation of the cached parts.
+@st.cache_resource(max_entries=1, show_spinner=False)
+def _read_samples(version):
+    parts = [_read_samples_file(version[0])]
+    parts += [_read_study(study_path(entry), entry["sha256"]) for entry in read_studies()]
+    if len(parts) == 1:
+        return parts[0]
+    sizes = [len(part["metadata"]) for part in parts]
+    return {
+        # Categories differ between the parts: the types are set again on the whole
+        "metadata": typed_metadata(pd.concat([part["metadata"] for part in parts], ignore_index=True)),
+        "abundance": merge_abundance([part["abundance"] for part in parts]),
+        "diversity": pd.concat([part["diversity"] for part in parts], ignore_index=True),
+        "index": merge_indexes([part["index"] for part in parts], sizes),
+    }
+
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def _read_clusters(stamp):
+    return read_dataset("clusters")
+
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def _read_references(stamp):
+    return read_dataset("references")
+
+
+# Metadata of the samples of all studies (gamze2.xlsx and the added studies), one
+# row per sample. Row label i is row i of the abundance matrix.
+def load_metadata():
+    with timed("load", "metadata"):
+        return _read_samples(samples_version())["metadata"]
+
+
+# Sparse taxa abundances of the samples (see abundance.py)
+def load_abundance():
+    with timed("load", "abundance"):
+        return _read_samples(samples_version())["abundance"]
+
+
+# Diversity indices and dominant taxa of the samples, one row per sample like
+# load_metadata() (see diversity.py)
+def load_diversity():
+    with timed("load", "diversity"):
+        return _read_samples(samples_version())["diversity"]
+
+
+# Version of the samples data, for the cache keys of results derived from it
+def samples_version():
+    studies = file_stamp(STUDIES_MANIFEST_PATH) if os.path.exists(STUDIES_MANIFEST_PATH) else None
+    return file_stamp(SAMPLES_PATH), studies
+
+
+# Stations with their cluster/subcluster assignment (cluster.csv)
+def load_clusters():
+    with timed("load", "clusters"):
+        return _read_clusters(file_stamp(CLUSTERS_PATH))
+
+
+# Version of the cluster data, for the cache keys of results derived from it
+def clusters_version():
+    return file_stamp(CLUSTERS_PATH)
+
+
+# Key references of the studies (references.csv)
+def load_references():
+    with timed("load", "references"):
+        return _read_references(file_stamp(REFERENCES_PATH))
+
+
+# Index of the Reference -> Station -> Depth hierarchy of the samples (see index_samples)
+def load_sample_index():
+    with timed("load", "sample index"):
+        return _read_samples(samples_version())["index"]
+
+
+# Values available at the next level below a selection, e.g.
+# sample_options() -> references, sample_options(reference) -> stations,
+# sample_options(reference, station) -> depths in core
+def sample_options(*keys):
+    return load_sample_index()["options"].get(keys, [])
+
+
+# Row positions of the samples belonging to a selection, e.g. sample_positions(reference, station)
+def sample_positions(*keys):
+    return load_sample_index()["rows"].get(keys, np.array([], dtype=np.intp))
+
+
+# Metadata rows of the samples belonging to a selection, e.g. sample_rows(reference, station)
+def sample_rows(*keys):
+    with timed("filter", "sample rows"):
+        return drop_unused_categories(load_metadata().iloc[sample_positions(*keys)])
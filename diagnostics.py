@@ -0,0 +1,111 @@
+import os
+import pandas as pd
+import streamlit as st
+from streamlit.runtime import Runtime
+from caching import cache_stats
+from profiling import load_module
+
+# Memory diagnostics, enabled for every session with APP_DIAGNOSTICS=1 or for one
+# session with the ?diagnostics=1 query parameter. A sidebar panel shows the memory
+# of the process, the size and hit rate of the shared caches (caching.py) and, on
+# demand, the memory of the abundance matrix, of the Streamlit caches and of every
+# active session, with an estimate of how many sessions fit in the memory limit of
+# the container.
+DIAGNOSTICS_ENV = os.environ.get("APP_DIAGNOSTICS", "") not in ("", "0")
+
+# Memory available to the process in MB. Read from the cgroup of the container when
+# APP_MEMORY_LIMIT_MB is not set.
+MEMORY_LIMIT_ENV = os.environ.get("APP_MEMORY_LIMIT_MB")
+CGROUP_LIMIT_FILES = ["/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"]
+
+
+def diagnostics_enabled():
+    return DIAGNOSTICS_ENV or st.experimental_get_query_params().get("diagnostics", ["0"])[0] not in ("", "0")
+
+
+# Resident memory of the process in MB (Linux), or None
+def process_memory_mb():
+    try:
+        with open("/proc/self/statm") as file:
+            pages = int(file.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+# Memory limit of the process in MB, or None when there is none
+def memory_limit_mb():
+    if MEMORY_LIMIT_ENV:
+        return float(MEMORY_LIMIT_ENV)
+    for path in CGROUP_LIMIT_FILES:
+        try:
+            with open(path) as file:
+                value = file.read().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < 1 << 60:  # "max" or a huge number means no limit
+            return int(value) / 1024 ** 2
+    return None
+
+
+# Memory of the Streamlit caches (st.cache_data, st.cache_resource, messages,
+# media) by category and cache, and the session state of every active session in
+# bytes. Each entry is measured with a deep size, so this takes a moment.
+def streamlit_memory():
+    if not Runtime.exists():
+        return pd.DataFrame(columns=["Category", "Cache", "Entries", "MB"]), []
+    stats = Runtime.instance().stats_mgr.get_stats()
+    sessions = [stat.byte_length for stat in stats if stat.category_name == "st_session_state"]
+    table = pd.DataFrame(
+        [(stat.category_name, stat.cache_name, stat.byte_length) for stat in stats
+         if stat.category_name != "st_session_state"],
+        columns=["Category", "Cache", "Bytes"],
+    )
+    table = table.groupby(["Category", "Cache"], as_index=False).agg(Entries=("Bytes", "size"), Bytes=("Bytes", "sum"))
+    table["MB"] = (table.pop("Bytes") / 1024 ** 2).round(2)
+    return table.sort_values("MB", ascending=False), sessions
+
+
+# Memory of the sparse abundance matrix of the samples in bytes (see abundance.py).
+# The data modules are only imported here, when the memory is measured.
+def abundance_memory():
+    abundance = load_module("dataset").load_abundance()
+    return load_module("abundance").abundance_nbytes(abundance)
+
+
+def measure_memory():
+    st.session_state["memory_report"] = streamlit_memory() + (abundance_memory(),)
+
+
+# Sidebar panel with the memory of the process, the shared caches and the sessions
+def show_diagnostics_panel():
+    if not diagnostics_enabled():
+        return
+    with st.sidebar.expander("Memory and caches", expanded=True):
+        rss = process_memory_mb()
+        limit = memory_limit_mb()
+        if rss is not None:
+            st.write(f"Process memory: **{rss:.0f} MB**" + (f" of {limit:.0f} MB" if limit else ""))
+
+        st.markdown("Shared caches (all sessions):")
+        st.dataframe(pd.DataFrame(cache_stats()), hide_index=True)
+
+        st.button("Measure the Streamlit caches and sessions", key="measure_memory_button", on_click=measure_memory)
+        report = st.session_state.get("memory_report")
+        if report is None:
+            return
+        table, sessions, abundance_bytes = report
+        st.write(f"Abundance matrix (sparse, shared): **{abundance_bytes / 1024 ** 2:.2f} MB**")
+        st.dataframe(table, hide_index=True)
+        if not sessions:
+            return
+        per_session = sum(sessions) / len(sessions) / 1024 ** 2
+        st.write(f"Active sessions: **{len(sessions)}**, session state {per_session:.2f} MB on average, "
+                 f"{max(sessions) / 1024 ** 2:.2f} MB at most")
+        # Everything but the session states is shared by the sessions of the process
+        if rss is not None and limit:
+            shared = rss - sum(sessions) / 1024 ** 2
+            st.write(f"Estimated capacity: **{max(0, int((limit - shared) / max(per_session, 0.01))):,} sessions** "
+                     f"({shared:.0f} MB shared)")
+            st.caption("Session states only: add the peak memory of the heaviest rerun "
+                       "(benchmark.py) for every session that reruns at the same time.")
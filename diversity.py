@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+
+# Diversity indices and dominant taxa of every sample, computed in one batched pass
+# over the nonzero entries of the sparse abundance matrix (see abundance.py) when
+# the samples are loaded, and kept next to the metadata. Abundances are relative
+# abundances in %; Fisher's alpha also needs the number of counted individuals (N).
+
+# Index columns, with their description for the help texts
+INDICES = {
+    "Taxa": "number of taxa found in the sample",
+    "Shannon H'": "Shannon diversity, -Σ p ln p",
+    "Simpson 1-D": "Gini-Simpson diversity, 1 - Σ p²",
+    "Evenness J'": "Pielou evenness, H' / ln(taxa)",
+    "Fisher α": "Fisher's alpha, from the taxa and the counted individuals N",
+    "Dominance": "Berger-Parker dominance, share of the most abundant taxon",
+}
+
+# Dominant taxa listed per sample
+TOP_TAXA = 3
+
+
+# Solve S = α ln(1 + N / α) for α, for all samples at once. The function is
+# concave and increasing in α, so Newton's method started below the root
+# converges monotonically. NaN where N is missing or not larger than S.
+def fisher_alpha(taxa, individuals, iterations=100):
+    taxa = np.asarray(taxa, dtype=float)
+    individuals = np.asarray(individuals, dtype=float)
+    valid = np.isfinite(individuals) & (taxa > 0) & (individuals > taxa)
+    s, n = taxa[valid], individuals[valid]
+    alpha = np.full(len(s), 1e-3)
+    for _ in range(iterations):
+        log_term = np.log1p(n / alpha)
+        step = (alpha * log_term - s) / (log_term - n / (alpha + n))
+        alpha = np.maximum(alpha - step, alpha / 2)
+        if np.all(np.abs(step) <= 1e-10 * alpha):
+            break
+    result = np.full(len(taxa), np.nan)
+    result[valid] = alpha
+    return result
+
+
+# "Taxon (share %)" of the TOP_TAXA most abundant taxa of every row, most abundant first
+def dominant_taxa(matrix, taxa, rows, shares):
+    order = np.lexsort((-shares, rows))  # By row, then from the most to the least abundant
+    counts = np.diff(matrix.indptr)
+    rank = np.arange(len(order)) - np.repeat(matrix.indptr[:-1], counts)
+    keep = order[rank < TOP_TAXA]
+    labels = pd.Series(
+        [f"{name} ({share:.1f}%)" for name, share in zip(taxa[matrix.indices[keep]], shares[keep] * 100)],
+        index=rows[keep],
+    )
+    return labels.groupby(level=0, sort=False).agg(", ".join).reindex(range(matrix.shape[0]), fill_value="")
+
+
+# Indices of every row of the abundance matrix, as a frame with the INDICES columns
+# and "Dominant taxa". `individuals` is the N of each sample (text or numbers,
+# missing values allowed).
+def diversity_indices(abundance, individuals):
+    matrix = abundance["matrix"]
+    n_rows = matrix.shape[0]
+    counts = np.diff(matrix.indptr)
+    rows = np.repeat(np.arange(n_rows), counts)
+    values = matrix.data.astype(float)
+
+    totals = np.bincount(rows, weights=values, minlength=n_rows)
+    shares = values / totals[rows]
+    shannon = -np.bincount(rows, weights=shares * np.log(shares), minlength=n_rows)
+    simpson = 1 - np.bincount(rows, weights=shares ** 2, minlength=n_rows)
+    dominance = np.zeros(n_rows)
+    np.maximum.at(dominance, rows, shares)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        evenness = np.where(counts > 1, shannon / np.log(counts), np.nan)
+
+    empty = counts == 0
+    n = pd.to_numeric(pd.Series(individuals), errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    return pd.DataFrame({
+        "Taxa": counts,
+        "Shannon H'": np.where(empty, np.nan, shannon),
+        "Simpson 1-D": np.where(empty, np.nan, simpson),
+        "Evenness J'": evenness,
+        "Fisher α": fisher_alpha(counts, n),
+        "Dominance": np.where(empty, np.nan, dominance),
+        "Dominant taxa": dominant_taxa(matrix, abundance["taxa"], rows, shares).to_numpy(),
+    })
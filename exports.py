@@ -0,0 +1,175 @@
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import unicodedata
+import zipfile
+import pandas as pd
+import streamlit as st
+from abundance import abundance_frame, nonzero_taxa
+from caching import cached_result
+from dataset import (BUILD_DIR, SOURCES, load_abundance, load_metadata, sample_options, sample_positions, source_hash,
+                     studies_hash)
+from schema import MISSING
+
+# Downloadable extracts of the data: the table of every reference in several
+# formats and a bundle of the whole data set. `python build.py exports` writes them
+# to data/build/exports/<data hash>/; the app serves the prebuilt files, or encodes
+# a missing one once, and keeps the bytes in a process-wide cache, so a download
+# is never re-encoded per request.
+
+EXPORTS_DIR = os.path.join(BUILD_DIR, "exports")
+
+# Export formats: name -> (file extension, MIME type)
+FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+    "Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+BUNDLE_NAME = "foraminifera_sea_of_marmara.zip"
+
+
+# Hash of all source files and added studies; a new version of any of them gets new exports
+def data_hash():
+    digest = hashlib.sha256()
+    for name in SOURCES:
+        digest.update(source_hash(name).encode("ascii"))
+    digest.update(studies_hash().encode("ascii"))
+    return digest.hexdigest()[:16]
+
+
+def export_dir(version):
+    return os.path.join(EXPORTS_DIR, version)
+
+
+# ASCII name usable in file names and URLs, e.g. "Kırcı-Elmas et al. 2008" -> "Kirci_Elmas_et_al_2008"
+def slug(text):
+    # The dotless ı of Turkish names has no ASCII decomposition
+    ascii_name = unicodedata.normalize("NFKD", text.replace("ı", "i")).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^A-Za-z0-9]+", "_", ascii_name).strip("_")
+
+
+# File name of a reference export, e.g. "Kirci_Elmas_et_al_2008.csv"
+def export_file_name(reference, fmt):
+    return f"{slug(reference)}.{FORMATS[fmt][0]}"
+
+
+# Samples of one reference with their metadata and the taxa found in them
+def reference_table(reference):
+    rows = sample_positions(reference)
+    metadata = load_metadata().iloc[rows]
+    abundance = load_abundance()
+    taxa = abundance_frame(abundance, rows, nonzero_taxa(abundance, rows), index=metadata.index)
+    return pd.concat([metadata, taxa], axis=1).reset_index(drop=True)
+
+
+# All samples with their metadata and every taxon of the vocabulary
+def full_table():
+    metadata = load_metadata()
+    taxa = abundance_frame(load_abundance(), metadata.index.to_numpy(), index=metadata.index)
+    return pd.concat([metadata, taxa], axis=1)
+
+
+def encode_table(table, fmt):
+    buffer = io.BytesIO()
+    if fmt == "CSV":
+        buffer.write(table.to_csv(index=False, na_rep=MISSING).encode("utf-8"))
+    elif fmt == "Parquet":
+        table.to_parquet(buffer, index=False)
+    elif fmt == "Excel":
+        table.to_excel(buffer, index=False, na_rep=MISSING, engine="openpyxl")
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
+    return buffer.getvalue()
+
+
+# Zip of the whole data set: all samples as CSV and Parquet, the table of every
+# reference as CSV and the original cluster, reference and taxa files
+def encode_bundle():
+    table = full_table()
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as bundle:
+        bundle.writestr("samples.csv", encode_table(table, "CSV"))
+        bundle.writestr("samples.parquet", encode_table(table, "Parquet"))
+        for reference in sample_options():
+            bundle.writestr(f"references/{export_file_name(reference, 'CSV')}", encode_table(reference_table(reference), "CSV"))
+        for name in ("clusters", "references", "taxa"):
+            path = SOURCES[name][0]
+            bundle.write(path, os.path.basename(path))
+    return buffer.getvalue()
+
+
+# Write the exports of the current data and a manifest of the files, and remove
+# the exports of older versions. Returns the export directory and the manifest.
+def build_exports():
+    version = data_hash()
+    directory = export_dir(version)
+    os.makedirs(directory, exist_ok=True)
+    files = {}
+    for reference in sample_options():
+        table = reference_table(reference)
+        for fmt in FORMATS:
+            files[export_file_name(reference, fmt)] = encode_table(table, fmt)
+    files[BUNDLE_NAME] = encode_bundle()
+
+    manifest = {"data_hash": version, "files": {}}
+    for file_name, content in files.items():
+        with open(os.path.join(directory, file_name), "wb") as file:
+            file.write(content)
+        manifest["files"][file_name] = {"bytes": len(content), "sha256": hashlib.sha256(content).hexdigest()}
+    with open(os.path.join(directory, "manifest.json"), "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
+
+    for name in os.listdir(EXPORTS_DIR):
+        if name != version:
+            shutil.rmtree(os.path.join(EXPORTS_DIR, name), ignore_errors=True)
+    return directory, manifest
+
+
+# Bytes of a prebuilt export, or None when it was not built for this version
+def _read_export(version, file_name):
+    path = os.path.join(export_dir(version), file_name)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def _reference_export(reference, fmt):
+    content = _read_export(data_hash(), export_file_name(reference, fmt))
+    return content if content is not None else encode_table(reference_table(reference), fmt)
+
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def _bundle_export(version):
+    content = _read_export(version, BUNDLE_NAME)
+    return content if content is not None else encode_bundle()
+
+
+@st.cache_resource(max_entries=len(SOURCES), show_spinner=False)
+def _source_file(name, version):
+    with open(SOURCES[name][0], "rb") as file:
+        return file.read()
+
+
+# Table of one reference in one of the FORMATS, as bytes
+def reference_export(reference, fmt):
+    return cached_result(_reference_export, data_hash(), reference, fmt, cache="exports")
+
+
+# Whether the bundle of the current data was written by `python build.py exports`
+def bundle_prebuilt():
+    return os.path.exists(os.path.join(export_dir(data_hash()), BUNDLE_NAME))
+
+
+# Bundle of the whole data set, as zip bytes
+def bundle_export():
+    return _bundle_export(data_hash())
+
+
+# Original source file of a dataset (e.g. "taxa"), as bytes
+def source_file(name):
+    return _source_file(name, source_hash(name))
@@ -0,0 +1,27 @@
+import hashlib
+import os
+
+# File helpers shared by the data loaders (dataset.py) and the image variants
+# (assets.py). Kept free of heavy imports, so that the pages that only show
+# images (Home) do not load pandas, scipy and the data.
+
+DATA_DIR = "data"
+
+# Build outputs: columnar copies of the data, exports and image variants
+BUILD_DIR = os.path.join(DATA_DIR, "build")
+
+
+# Modification stamp of a source file. It is passed as an argument to the cached
+# readers, so an edited file gets a new cache key and is re-read on the next rerun.
+def file_stamp(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+# Content hash of a source file, recorded in the build manifests
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,12 @@
+import streamlit as st
+
+# Footer shown at the bottom of every page. It lives in its own module so that light
+# pages (Home, References) do not import the analysis page and its dependencies.
+def add_footer():
+    st.markdown("""
+    <div style="text-align: center; font-size: 10px; margin-top: 30px;">
+        <a href="https://github.com/isik-hilal" target="_blank">GitHub</a> | 
+        <a href="https://www.linkedin.com/in/hilal-isik/" target="_blank">LinkedIn</a><br>
+        <span style="font-size: 8px;">Hilal Işık</span>
+    </div>
+    """, unsafe_allow_html=True)
@@ -0,0 +1,117 @@
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from unittest.mock import MagicMock
+
+from streamlit import config
+from streamlit.runtime import Runtime
+from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.runtime.scriptrunner import RerunData, ScriptRunnerEvent
+from streamlit.testing import element_tree
+from streamlit.testing.local_script_runner import LocalScriptRunner
+
+# Runs app.py without a browser or server, with Streamlit's script-runner testing
+# API: used by the benchmark (benchmark.py) and the static snapshot (snapshot.py).
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_SCRIPT = os.path.join(APP_DIR, "app.py")
+
+# Seconds to wait for a rerun before giving up
+TIMEOUT = 300
+
+
+# The app is run without a server: a stand-in runtime gives the scripts working
+# st.cache_data/st.cache_resource and media storage. Returns the media storage.
+def install_runtime():
+    os.chdir(APP_DIR)
+    if APP_DIR not in sys.path:
+        sys.path.insert(0, APP_DIR)
+    logging.disable(logging.WARNING)
+    config.set_option("runner.postScriptGC", False)
+    storage = MemoryMediaFileStorage("/media")
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(storage)
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = runtime
+
+    # The test tree of Streamlit 1.27 cannot parse layout blocks without a type
+    # (st.columns, st.container); read them as plain containers.
+    block_init = element_tree.Block.__init__
+
+    def init(self, root, proto=None, type=None):
+        if proto is not None and proto.WhichOneof("type") is None:
+            proto, type = None, "container"
+        block_init(self, root, proto, type)
+
+    element_tree.Block.__init__ = init
+    return storage
+
+
+# Script runner that runs the app once and times the rerun from the start to the
+# end of the script. `values` presets widgets by key, like st.session_state.
+class HeadlessRunner(LocalScriptRunner):
+    def __init__(self, session_state=None, values=None):
+        super().__init__(APP_SCRIPT, session_state)
+        for key, value in (values or {}).items():
+            self.session_state[key] = value
+        self.started = self.stopped = None
+
+        def record_time(sender, event, **kwargs):
+            if event == ScriptRunnerEvent.SCRIPT_STARTED:
+                self.started = time.perf_counter()
+            elif event in (ScriptRunnerEvent.SCRIPT_STOPPED_WITH_SUCCESS,
+                           ScriptRunnerEvent.SCRIPT_STOPPED_WITH_COMPILE_ERROR,
+                           ScriptRunnerEvent.SCRIPT_STOPPED_FOR_RERUN):
+                self.stopped = time.perf_counter()
+
+        self.on_event.connect(record_time, weak=False)
+
+    # Run the script and return the element tree and the statistics of the rerun
+    def run_once(self, widget_states=None, trace_memory=False):
+        if trace_memory:
+            tracemalloc.reset_peak()
+        self.request_rerun(RerunData(widget_states=widget_states))
+        self.start()
+        deadline = time.perf_counter() + TIMEOUT
+        while self.stopped is None:
+            if time.perf_counter() > deadline:
+                self.request_stop()
+                raise RuntimeError(f"rerun did not finish within {TIMEOUT} s")
+            time.sleep(0.002)
+        self.join()
+
+        messages = [msg for msg in self.forward_msgs() if msg.HasField("delta")]
+        tree = element_tree.parse_tree_from_messages(self.forward_msgs())
+        tree.script_path = APP_SCRIPT
+        tree._session_state = self.session_state
+        return tree, {
+            "wall_ms": round((self.stopped - self.started) * 1000, 1),
+            "peak_memory_kb": round(tracemalloc.get_traced_memory()[1] / 1024) if trace_memory else None,
+            "elements": sum(msg.delta.WhichOneof("type") == "new_element" for msg in messages),
+            "bytes": sum(msg.ByteSize() for msg in messages),
+            "exceptions": [exception.value for exception in tree.get("exception")],
+        }
+
+
+def find_widget(tree, kind, name):
+    for widget in tree.get(kind):
+        if widget.key == name or widget.label == name:
+            return widget
+    raise LookupError(f"No {kind} '{name}' on the page")
+
+
+# Change a widget like a user would and return the widget states for the next rerun.
+# An int value of a selectbox, radio or multiselect picks the option at that position.
+def apply_step(tree, kind, name, value):
+    widget = find_widget(tree, kind, name)
+    if kind in ("selectbox", "radio") and isinstance(value, int):
+        widget.set_value(widget.options[value])
+    elif kind == "multiselect":
+        widget.select(widget.options[value] if isinstance(value, int) else value)
+    else:
+        widget.set_value(value)
+    return tree.get_widget_states()
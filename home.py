@@ -1,6 +1,6 @@
 import streamlit as st
-from PIL import Image
-from analysis import add_footer
+from assets import show_image
+from footer import add_footer
 
 def show_home():
     # Title of the page
@@ -152,11 +152,10 @@ AMBI.
 
     # In the first column (left), display images
     with col1:
-        gamze_image = Image.open("images/gamze_tanik.jpg")  # Ensure the image is in the correct folder
-        st.image(gamze_image, width=100)  # Set width to 100 pixels for a small image
-        
-        metu_logo = Image.open("images/metu_logo.jpeg")  # Ensure the logo image is in the images folder
-        st.image(metu_logo, width=100)  # Set width to 100 pixels for the logo
+        # Small variants of the images, encoded once per process
+        show_image("gamze_tanik")
+
+        show_image("metu_logo")
 
     # In the second column (right), display contact info
     with col2:
@@ -0,0 +1,200 @@
+import json
+import os
+import re
+from datetime import datetime, timezone
+import pandas as pd
+from dataset import (STUDIES_DIR, STUDIES_MANIFEST_PATH, file_hash, load_abundance, load_metadata, read_studies,
+                     study_path)
+from exports import slug
+from schema import METADATA_COLUMNS, METADATA_DTYPES, MISSING, OPTIONAL_COLUMNS, taxon_columns, typed_metadata
+from taxonomy import load_taxonomy, strip_authority, taxon_key
+
+# Ingestion of a new study: `python build.py ingest <file>` reads a study file in
+# the layout of the samples file (the metadata columns, then one column per
+# taxon), validates it against the samples already in the data, matches its taxa
+# to the shared vocabulary and stores it as one Parquet partition in data/studies/.
+# The samples file and the other partitions are not touched: the app reads the new
+# partition on its next rerun and keeps the others from its cache.
+
+# Columns whose values must be among the values already in the data
+CATEGORICAL_COLUMNS = ["Type", "L/D/U"]
+
+# Valid range of numeric columns (None: no bound)
+RANGES = {
+    "Lat": (-90, 90),
+    "Long": (-180, 180),
+    "Depth_in_core": (0, None),
+    "Water_depth": (0, None),
+    "Size_fraction": (0, None),
+    "S": (0, None),
+}
+
+# Row numbers listed in a problem
+MAX_LISTED_ROWS = 5
+
+
+def read_study_file(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".xlsx":
+        data = pd.read_excel(path, engine="openpyxl")
+    elif extension == ".csv":
+        data = pd.read_csv(path)
+    elif extension == ".parquet":
+        data = pd.read_parquet(path)
+    else:
+        raise ValueError(f"Unsupported study file {path}: use .xlsx, .csv or .parquet")
+    data.columns = data.columns.astype(str).str.strip()
+    # Drop unnamed helper columns, like in the samples file
+    return data.loc[:, ~data.columns.str.contains('^Unnamed')].reset_index(drop=True)
+
+
+# Row numbers of the study file (header on row 1) where `mask` is true
+def file_rows(mask):
+    rows = [str(position + 2) for position in mask.to_numpy().nonzero()[0][:MAX_LISTED_ROWS]]
+    more = int(mask.sum()) - len(rows)
+    return ", ".join(rows) + (f" and {more} more" if more > 0 else "")
+
+
+# Name of every taxon column of the study in the shared vocabulary: the name of a
+# taxon already in the data, else the code of the taxa list (taxa.xlsx) for any of
+# its names or synonyms (`taxa_names`, see taxonomy.py), else the column name with
+# underscores. Returns the mapping, the taxa new to the data and the new taxa that
+# are not in the taxa list either.
+def match_taxa(columns, vocabulary, taxa_names):
+    names = dict(taxa_names)
+    names.update({taxon_key(name): name for name in vocabulary})
+    mapping = {}
+    for column in columns:
+        # Column names may carry the authority, e.g. "Ammonia tepida (Cushman, 1926)"
+        name = names.get(taxon_key(column)) or names.get(taxon_key(strip_authority(column)))
+        mapping[column] = name or re.sub(r"\s+", "_", column.strip())
+    known = set(vocabulary)
+    new = [name for name in mapping.values() if name not in known]
+    listed = set(taxa_names.values())
+    return mapping, new, [name for name in new if name not in listed]
+
+
+# Check a study file against the samples in the data (`metadata`). Returns the
+# metadata of the study with the types of the data, its abundances and a list of
+# problems (empty if the study can be added).
+def validate_study(data, metadata):
+    missing = [column for column in METADATA_COLUMNS if column not in data.columns]
+    if missing:
+        return None, None, [f"missing metadata columns: {', '.join(missing)}"]
+    if data.empty:
+        return None, None, ["the file has no samples"]
+
+    problems = []
+    study = pd.DataFrame(index=data.index)
+    for column in METADATA_COLUMNS:
+        dtype = METADATA_DTYPES[column]
+        if dtype == "category":
+            values = data[column].astype("string").str.strip()
+            empty = values.isna() | (values == "")
+            if empty.any():
+                problems.append(f"{column}: empty on rows {file_rows(empty)}")
+        else:
+            text = data[column].astype("string").str.strip()
+            # Optional columns may be empty or "-", like TOC and N in the samples file
+            missing = text.isna() | text.isin(["", MISSING])
+            values = pd.to_numeric(text.mask(missing), errors="coerce")
+            invalid = values.isna() & ~missing if column in OPTIONAL_COLUMNS else values.isna()
+            low, high = RANGES.get(column, (None, None))
+            if low is not None:
+                invalid |= values < low
+            if high is not None:
+                invalid |= values > high
+            if dtype.lower().startswith("int"):
+                invalid |= values.notna() & (values % 1 != 0)
+            if invalid.any():
+                problems.append(f"{column}: missing, not a number or out of range on rows {file_rows(invalid)}")
+        study[column] = values
+
+    for column in CATEGORICAL_COLUMNS:
+        allowed = set(metadata[column].dropna())
+        unknown = sorted(set(study[column].dropna()) - allowed)
+        if unknown:
+            problems.append(f"{column}: unknown values {unknown}, expected one of {sorted(allowed)}")
+
+    for column in ["Code", "Reference"]:
+        values = study[column].dropna().unique()
+        if len(values) != 1:
+            problems.append(f"{column}: a study has a single {column}, found {len(values)}")
+        elif values[0] in set(metadata[column]):
+            problems.append(f"{column} '{values[0]}' is already in the data")
+
+    duplicated = study.duplicated(["Station", "Depth_in_core"], keep=False)
+    if duplicated.any():
+        problems.append(f"Station and Depth_in_core: repeated on rows {file_rows(duplicated)}")
+
+    # Every other column is a taxon: abundances are numbers >= 0; empty cells (taxon
+    # not counted) stay NaN and are kept as missing (see abundance.build_abundance)
+    taxa = data[taxon_columns(data.columns)]
+    abundances = taxa.apply(pd.to_numeric, errors="coerce")
+    invalid = (abundances.isna() & taxa.notna()) | (abundances < 0)
+    for column in invalid.columns[invalid.any()]:
+        problems.append(f"taxon {column}: not a number or negative on rows {file_rows(invalid[column])}")
+    if not problems:
+        study = typed_metadata(study)
+    return study, abundances, problems
+
+
+def write_studies_manifest(studies):
+    path = STUDIES_MANIFEST_PATH + ".tmp"
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump({"studies": studies}, file, indent=2, ensure_ascii=False)
+    os.replace(path, STUDIES_MANIFEST_PATH)  # Readers never see a half-written manifest
+
+
+# Add the study of a file to the data, or update a study added before when
+# `replace` is set. Raises ValueError with the list of problems when the file does
+# not validate. Returns the manifest entry of the study.
+def ingest_study(path, replace=False):
+    data = read_study_file(path)
+    metadata = load_metadata()
+    abundance = load_abundance()
+    studies = read_studies()
+
+    if replace and "Code" in data.columns:
+        code = str(data["Code"].iloc[0]).strip() if len(data) else None
+        previous = [entry for entry in studies if entry["code"] == code]
+        if not previous:
+            raise ValueError(f"Code '{code}' is not an added study: only added studies can be replaced")
+        # Validate against the data without the previous version of the study
+        metadata = metadata[metadata["Code"] != code]
+    study, abundances, problems = validate_study(data, metadata)
+    if problems:
+        raise ValueError("\n".join(problems))
+
+    mapping, new_taxa, unlisted_taxa = match_taxa(abundances.columns, abundance["taxa"], load_taxonomy()["names"])
+    if len(set(mapping.values())) < len(mapping):
+        repeated = sorted({name for name in mapping.values() if list(mapping.values()).count(name) > 1})
+        raise ValueError(f"several columns are the same taxon: {', '.join(repeated)}")
+    abundances = abundances.rename(columns=mapping)
+    abundances = abundances.loc[:, (abundances > 0).any()]  # Only the taxa found in the study
+
+    code, reference = study["Code"].iloc[0], study["Reference"].iloc[0]
+    entry = {
+        "code": code,
+        "reference": reference,
+        "file": f"{slug(code)}.parquet",
+        "source": os.path.basename(path),
+        "rows": len(study),
+        "stations": int(study["Station"].nunique()),
+        "taxa": abundances.shape[1],
+        "new_taxa": [name for name in new_taxa if name in abundances.columns],
+        "unlisted_taxa": [name for name in unlisted_taxa if name in abundances.columns],
+        "ingested": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    os.makedirs(STUDIES_DIR, exist_ok=True)
+    pd.concat([study, abundances.astype("float32")], axis=1).to_parquet(study_path(entry), index=False)
+    entry["sha256"] = file_hash(study_path(entry))
+
+    # A replaced study keeps its place, so its rows and color do not move
+    codes = [other["code"] for other in studies]
+    if code in codes:
+        studies[codes.index(code)] = entry
+    else:
+        studies.append(entry)
+    write_studies_manifest(studies)
+    return entry
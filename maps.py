@@ -1,42 +1,179 @@
+import colorsys
 import streamlit as st
 import pandas as pd
+import numpy as np
+import plotly.graph_objects as go
 import plotly.express as px
-from plotly.subplots import make_subplots
+from abundance import abundance_frame, nonzero_taxa
+from caching import cached_figure
+from exports import FORMATS, export_file_name, reference_export
+from profiling import timed
+from spatial import load_station_index, stations_in_box, stations_in_polygon
+from tables import show_paged_table
+from diversity import INDICES
+from schema import MISSING, TABLE_COLUMNS, with_missing_marks
+from dataset import load_abundance, load_diversity, load_metadata, sample_options, sample_positions, sample_rows, samples_version
 
+# Colors of the references, given in order of first appearance in the data: the
+# studies of the samples file, then the added studies (see ingest.py)
+REFERENCE_PALETTE = [
+    "#1f77b4",  # Blue
+    "#8c564b",  # Brown
+    "#d49a6a",  # Light Brown
+    "#b5634f",  # Burnt Orange
+    "#bcbd22",  # Yellow-green
+    "#e377c2",  # Pink
+    "#7f7f7f",  # Gray
+    "#8e44ad",  # Purple
+    "#f1c40f",  # Gold
+    "#ba55d3",  # Lavender
+    "#ff7f0e",  # Bright Orange
+    "#2ca02c",  # Green
+    "#d62728",  # Red
+    "#17becf",  # Cyan
+    "#34495e",  # Slate
+    "#1abc9c",  # Turquoise
+    "#a04000",  # Rust
+    "#5b2c6f",  # Plum
+    "#7dcea0",  # Sage
+    "#2e86c1",  # Steel Blue
+]
+
+
+# Color of the reference at a position; past the palette the hues are spread by
+# the golden angle, so neighbouring references stay apart
+def reference_color(position):
+    if position < len(REFERENCE_PALETTE):
+        return REFERENCE_PALETTE[position]
+    red, green, blue = colorsys.hls_to_rgb((position * 0.618033988749895) % 1, 0.45, 0.65)
+    return f"#{round(red * 255):02x}{round(green * 255):02x}{round(blue * 255):02x}"
+
+
+# Reference -> color, for every reference in the data
+def reference_colors():
+    return {reference: reference_color(position) for position, reference in enumerate(sample_options())}
 
-# Read the data
-def load_data():
-    # Load the data from the Excel file (make sure it's in the 'data' folder)
-    data = pd.read_excel("data/gamze2.xlsx", engine="openpyxl")
-    
-    return data
 
 # First Map: General map showing all data points with different colors
 def create_first_map():
-    datatoc = load_data()
-
     # Display information above the map
     st.write(
-        """
-        **About this map**: This interactive map shows in total **144 stations** coming from **11 different quantitative benthic foraminifera studies** 
+        f"""
+        **About this map**: This interactive map shows in total **{station_count()} stations** coming from **{len(sample_options())} different quantitative benthic foraminifera studies** 
         (including this study).
         """
     )
     
-    # Define custom colors for the references
-    colors = [
-        "#1f77b4",  # Blue
-        "#8c564b",  # Brown
-        "#d49a6a",  # Light Brown
-        "#b5634f",  # Burnt Orange
-        "#bcbd22",  # Yellow-green
-        "#e377c2",  # Pink
-        "#7f7f7f",  # Gray
-        "#8e44ad",  # Purple
-        "#f1c40f",  # Gold
-        "#ba55d3",  # Lavender
-        "#ff7f0e",  # Bright Orange
-    ]
+    # One marker per station, with its samples summarized in the info box and nearby
+    # stations clustered when zoomed out, or one marker per sample
+    col1, col2 = st.columns(2)
+    with col1:
+        map_mode = st.radio("Markers:", MAP_MODES, horizontal=True, key="first_map_mode")
+    with col2:
+        color_by = st.selectbox("Color by:", ["Reference"] + list(INDICES), key="first_map_color")
+
+    # Map figure, built once per version of the data, marker mode and coloring, and
+    # shared by all sessions
+    fig1 = cached_figure(first_map_figure, samples_version(), map_mode, color_by)
+
+     # Display the map in Streamlit
+    with timed("serialize", "map of all data points"):
+        st.plotly_chart(fig1)
+
+    # Add the note
+    st.markdown(
+    """
+    <p style="font-size:10px; font-style:italic; color:gray;">
+    The purple borders are administrative or jurisdictional boundaries included in the OpenStreetMap base layer. 
+    These can represent country, state, or municipality borders, and they are part of the default map.
+    </p>
+    """,
+    unsafe_allow_html=True)
+
+    # Add info box explanation
+    st.markdown(
+        """
+        <h3 style=" font-size: 10px;">Explanation of Info Box</h3>
+        <p style="font-size:10px;">
+        <strong>Type:</strong> Core (C) or Grab (G)<br>
+        <strong>Station:</strong> Station name, original, as in publications.<br>
+        <strong>Depth_in_core:</strong> (cm) for type =core (C) the bottom level of sampled interval (e.g. Depth_in_core = 4 for sampling between 2-4 cm); for type = grab (G) 0.5 cm unless otherwise specified in the reference.<br>
+        <strong>Water depth:</strong> station water depth (m)<br>
+        <strong>TOC:</strong> total organic carbon, as percentage."-" If data do not exists. TOC for SoM_2 taken from du Chatelet et al. 2013.<br>
+        <strong>L/D/U:</strong> Studied type of assemblage, live/dead/undifferentiated<br>
+        <strong>Size_fraction:</strong> Studied size fraction, micrometers<br>
+        <strong>S:</strong> Number of identified taxa in the study<br>
+        <strong>N:</strong> Counted number of foraminifera, as reported in publications, "-" if data do not exist<br>
+        <strong>Samples:</strong> With one marker per station, the number of samples of the station; Depth_in_core, TOC and S then give the lowest and highest value of its samples, and N the total of its samples<br></p>
+    """, unsafe_allow_html=True)
+
+
+
+# Marker modes of the first map
+MAP_MODES = ["One per station", "One per sample"]
+
+# Stations are clustered on the first map up to this zoom level (the map opens at 7)
+CLUSTER_MAX_ZOOM = 6
+
+
+# "low-high" for every row, or a single value when both are the same ("-" when missing)
+def value_range(low, high, decimals=1):
+    low_text = low.round(decimals).astype("string").fillna(MISSING)
+    high_text = high.round(decimals).astype("string").fillna(MISSING)
+    return low_text.where(low.eq(high) | high.isna(), low_text + "–" + high_text)
+
+
+# One row per station with a summary of its samples, for the info box of the first map
+def station_summary():
+    metadata = load_metadata()
+    groups = metadata.groupby(['Reference', 'Station'], sort=False, observed=True)
+    # Diversity indices of a station: the mean over its samples
+    indices = load_diversity()[list(INDICES)].groupby(
+        [metadata['Reference'], metadata['Station']], sort=False, observed=True
+    ).mean()
+    summary = groups.agg(
+        Lat=('Lat', 'first'), Long=('Long', 'first'), Type=('Type', 'first'), Samples=('Lat', 'size'),
+        depth_min=('Depth_in_core', 'min'), depth_max=('Depth_in_core', 'max'),
+        Water_depth=('Water_depth', 'first'), toc_min=('TOC', 'min'), toc_max=('TOC', 'max'),
+        LDU=('L/D/U', 'first'), s_min=('S', 'min'), s_max=('S', 'max'), N=('N', 'sum'),
+    ).reset_index()
+    return pd.DataFrame({
+        'Reference': summary['Reference'],
+        'Station': summary['Station'],
+        'Lat': summary['Lat'],
+        'Long': summary['Long'],
+        'Type': summary['Type'],
+        'Samples': summary['Samples'],
+        'Depth_in_core': value_range(summary['depth_min'], summary['depth_max']),
+        'Water_depth': summary['Water_depth'],
+        'TOC': value_range(summary['toc_min'], summary['toc_max'], 2),
+        'L/D/U': summary['LDU'],
+        'S': value_range(summary['s_min'], summary['s_max'], 0),
+        'N (all samples)': summary['N'].where(groups['N'].count().to_numpy() > 0).astype('string').fillna(MISSING),
+        **{name: indices[name].to_numpy() for name in INDICES},
+    })
+
+
+# Number of stations of all references
+def station_count():
+    return sum(len(sample_options(reference)) for reference in sample_options())
+
+
+# Figure of the first map, with one marker per station or per sample,
+# colored by reference or by a diversity index
+def first_map_figure(map_mode="One per sample", color_by="Reference"):
+    if map_mode == "One per station":
+        datatoc = station_summary()
+        counts = {'Samples': True, 'N (all samples)': True}
+    else:
+        datatoc = pd.concat([with_missing_marks(load_metadata()), load_diversity()[list(INDICES)]], axis=1)
+        counts = {'N': True}
+    if color_by == "Reference":
+        colors = dict(color_discrete_map=reference_colors())  # Automatic color of every reference
+    else:
+        # Index of the sample, or mean index of the samples of the station
+        counts[color_by] = ':.2f'
+        colors = dict(color_continuous_scale='Viridis')
 
     # Create the map with Plotly
     fig1 = px.scatter_mapbox(
@@ -55,15 +192,18 @@ def create_first_map():
             'TOC': True,
             'L/D/U': True,
             'S': True,
-            'N': True
+            **counts,
         },
-        color='Reference',
-        color_discrete_sequence=colors,  # Use the custom color palette
+        color=color_by,
+        **colors,
         zoom=5,
         height=600
     )
 
     fig1.update_traces(marker=dict(opacity=0.7, size=10))  # Set marker transparency and size
+    if map_mode == "One per station":
+        # Nearby stations of a reference are drawn as one bubble when zoomed out
+        fig1.update_traces(cluster=dict(enabled=True, maxzoom=CLUSTER_MAX_ZOOM, opacity=0.7))
 
     fig1.update_layout(
         mapbox_style="open-street-map",
@@ -79,67 +219,103 @@ def create_first_map():
         ),
         margin={"r":0, "t":50, "l":0, "b":0}
     )
+    return fig1
 
-     # Display the map in Streamlit
-    st.plotly_chart(fig1)
 
-    # Add the note
+# Second Map: Map with dropdown to filter by reference
+def create_second_map():
+    # Dropdown for selecting reference
+    unique_references = sample_options()
+    selected_reference = st.selectbox("Select a Reference", unique_references)
+    
+    # Rows of the selected reference, from the prebuilt sample index
+    filtered_data = sample_rows(selected_reference)
+
+    # Map figure, cached per selected reference
+    fig2 = cached_figure(second_map_figure, samples_version(), selected_reference)
+
+    # Display the map in Streamlit
+    with timed("serialize", "reference map"):
+        st.plotly_chart(fig2)
+
+    # Metadata columns of the tables (see schema.py), without null or zero values
+    filtered_columns = [
+        col for col in TABLE_COLUMNS if filtered_data[col].notna().any() and (filtered_data[col] != 0).any()
+    ]
+
+    # Display the filtered table beneath the map
+        
+    st.markdown(f"### Filtered Data for {selected_reference}")
     st.markdown(
     """
     <p style="font-size:10px; font-style:italic; color:gray;">
-    The purple borders are administrative or jurisdictional boundaries included in the OpenStreetMap base layer. 
-    These can represent country, state, or municipality borders, and they are part of the default map.
+    The paged view shows the most abundant taxa first; choose another group of taxa or page through the samples.
+    Download the whole table of the reference as CSV, Parquet or Excel with the button below the table.
+    See supplementary material in References Section for full names of taxa.
     </p>
     """,
     unsafe_allow_html=True)
 
-    # Add info box explanation
-    st.markdown(
-        """
-        <h3 style=" font-size: 10px;">Explanation of Info Box</h3>
-        <p style="font-size:10px;">
-        <strong>Type:</strong> Core (C) or Grab (G)<br>
-        <strong>Station:</strong> Station name, original, as in publications.<br>
-        <strong>Depth_in_core:</strong> (cm) for type =core (C) the bottom level of sampled interval (e.g. Depth_in_core = 4 for sampling between 2-4 cm); for type = grab (G) 0.5 cm unless otherwise specified in the reference.<br>
-        <strong>Water depth:</strong> station water depth (m)<br>
-        <strong>TOC:</strong> total organic carbon, as percentage."-" If data do not exists. TOC for SoM_2 taken from du Chatelet et al. 2013.<br>
-        <strong>L/D/U:</strong> Studied type of assemblage, live/dead/undifferentiated<br>
-        <strong>Size_fraction:</strong> Studied size fraction, micrometers<br>
-        <strong>S:</strong> Number of identified taxa in the study<br>
-        <strong>N:</strong> Counted number of foraminifera, as reported in publications, "-" if data do not exist<br></p>
-    """, unsafe_allow_html=True)
+    rows = filtered_data.index.to_numpy()
+    table_view = st.radio("Table view:", ["Paged", "Full table"], horizontal=True, key="filtered_data_view")
+    if table_view == "Paged":
+        # Only the visible page of samples and group of taxa is built and sent
+        show_paged_table(filtered_data[filtered_columns], rows, key="filtered_data")
+    else:
+        show_full_table(filtered_data[filtered_columns], rows)
 
+    # Prebuilt extract of the selected reference, served from the cache
+    col1, col2 = st.columns([1, 2])
+    with col1:
+        export_format = st.selectbox("Download format:", list(FORMATS), key="filtered_data_format")
+    with col2:
+        st.markdown("<br>", unsafe_allow_html=True)
+        st.download_button(
+            label=f"📥 Download {selected_reference} ({export_format})",
+            data=reference_export(selected_reference, export_format),
+            file_name=export_file_name(selected_reference, export_format),
+            mime=FORMATS[export_format][1],
+            key="filtered_data_download",
+        )
+#empty spaces
+    st.markdown("<br><br>", unsafe_allow_html=True)
+    st.write("------")
 
 
-# Second Map: Map with dropdown to filter by reference
-def create_second_map():
-    datatoc = load_data()
-    
-    # Dropdown for selecting reference
-    unique_references = datatoc['Reference'].unique()
-    selected_reference = st.selectbox("Select a Reference", unique_references)
-    
-    # Filter data based on the selected reference
-    filtered_data = datatoc[datatoc['Reference'] == selected_reference]
+# Whole table of the selected samples with every taxon found in them
+def show_full_table(metadata, rows):
+    # Taxa found in the selected rows, looked up in the sparse abundance matrix
+    with timed("filter", "full table"):
+        abundance = load_abundance()
+        taxa_data = abundance_frame(abundance, rows, nonzero_taxa(abundance, rows), index=metadata.index)
+
+        final_data = pd.concat([with_missing_marks(metadata), taxa_data], axis=1)
+
+    st.dataframe(
+    final_data.style
+    .set_properties(**{
+        'font-size': '7px',
+        'width': '60px',
+        'text-align': 'left'
+    })
+    .set_table_styles([
+        {
+            'selector': 'th',
+            'props': [
+                ('writing-mode', 'vertical-lr'),
+                ('text-orientation', 'mixed'),
+                ('transform', 'rotate(45deg)'),
+                ('height', '100px')
+            ]
+        }
+    ])
+    .format(precision=2, na_rep=MISSING)  # Keep values formatted to 3 decimal places
+)
 
-    # Define custom colors for the references
-    
-    reference_color_map = {
-        "Fontanier et al. 2018": "#1f77b4",  # Blue
-        "Phipps et al. 2010": "#8c564b",  # Brown
-        "Kırcı-Elmas 2006": "#d49a6a",  # Light Brown
-        "Kırcı-Elmas 2018": "#b5634f",  # Burnt Orange
-        "Kırcı-Elmas 2013": "#bcbd22",  # Yellow-green
-        "Avşar 2010": "#e377c2",  # Pink
-        "Kırcı-Elmas et al. 2008": "#7f7f7f",  # Gray
-        "Kaminski et al. 2002": "#8e44ad",  # Purple
-        "Avşar et al. 2006": "#f1c40f",  # Gold
-        "Alavi 1988": "#ba55d3",  # Lavender
-        "This study": "#ff7f0e",  # Bright Orange
-    }
-    
-     # Ensure all `Reference` values in filtered_data exist in the color map
-    filtered_data = filtered_data[filtered_data['Reference'].isin(reference_color_map.keys())]
+
+# Figure of the second map for one reference
+def second_map_figure(selected_reference):
+    filtered_data = with_missing_marks(sample_rows(selected_reference))
 
     # Create the map with the filtered data
     fig2 = px.scatter_mapbox(
@@ -159,7 +335,7 @@ def create_second_map():
             'N': True
         },
         color='Reference',
-        color_discrete_map=reference_color_map,  # Highlight the selected reference in orange
+        color_discrete_map=reference_colors(),  # Automatic color of every reference
         zoom=7,
         height=600
     )
@@ -180,56 +356,128 @@ def create_second_map():
         ),
         margin={"r":0, "t":50, "l":0, "b":0}
     )
+    return fig2
 
-    # Display the map in Streamlit
-    st.plotly_chart(fig2)
 
-    # Prepare columns without null or zero values
-    non_null_columns = [
-        col for col in filtered_data.columns if filtered_data[col].notna().any() and (filtered_data[col] != 0).any()
-]
+# Corners of the example polygon of the area selection (around the Gulf of İzmit)
+DEFAULT_POLYGON = """40.80, 29.30
+40.80, 29.95
+40.65, 29.95
+40.65, 29.30"""
 
-    # Exclude unwanted columns explicitly
-    unwanted_columns = {"Code","Reference", "Type", "Lat", "Long", "L/D/U", "Size_fraction", "S", "N", "Unnamed: 450"}
-    filtered_columns = [col for col in non_null_columns if col not in unwanted_columns]
 
+# Polygon corners from text with one "latitude, longitude" per line, or None when
+# the text is not a polygon
+def parse_polygon(text):
+    corners = []
+    for line in text.strip().splitlines():
+        try:
+            lat, lon = (float(value) for value in line.replace(";", ",").split(","))
+        except ValueError:
+            return None
+        corners.append((lat, lon))
+    return tuple(corners) if len(corners) >= 3 else None
 
-    final_data=filtered_data[filtered_columns]
 
-    # Display the filtered table beneath the map
-        
-    st.markdown(f"### Filtered Data for {selected_reference}")
-    st.markdown(
-    """
-    <p style="font-size:10px; font-style:italic; color:gray;">
-    Use the interactive button on the right corner to download the table as a csv file. See supplementary material in References Section for full names of taxa.
-    </p>
-    """,
-    unsafe_allow_html=True)
+# Open a station of the area selection in the Single View (runs before the rerun,
+# so the page and the selectors of the Single View take these values)
+def open_in_single_view(reference, station):
+    st.session_state["page"] = "Single View"
+    st.session_state["single_view_reference"] = reference
+    st.session_state["single_view_station"] = station
+    st.session_state.pop("single_view_depth", None)
 
-    st.dataframe(
-    final_data.style
-    .set_properties(**{
-        'font-size': '7px',
-        'width': '60px',
-        'text-align': 'left'
-    })
-    .set_table_styles([
-        {
-            'selector': 'th',
-            'props': [
-                ('writing-mode', 'vertical-lr'),
-                ('text-orientation', 'mixed'),
-                ('transform', 'rotate(45deg)'),
-                ('height', '100px')
-            ]
-        }
-    ])
-    .format(precision=2)  # Keep values formatted to 3 decimal places
-)
-#empty spaces
-    st.markdown("<br><br>", unsafe_allow_html=True)
-    st.write("------")
 
+# Third part of the Maps page: stations of an area, chosen with a box (latitude and
+# longitude ranges) or a polygon, answered from the spatial index of the stations
+def create_area_selection():
+    st.write(
+        """
+        Select the stations of an area with a latitude and longitude box, or with a polygon given by its corners.
+        The samples of the selected stations are listed below the map, and each station can be opened in the Single View.
+        """
+    )
+    # Slider ranges: the bounds of the stations, with a margin of one step
+    bounds = load_station_index()["grid"]["bounds"]
+    lat_min, lon_min = (round(value - 0.01, 2) for value in bounds[0::2])
+    lat_max, lon_max = (round(value + 0.01, 2) for value in bounds[1::2])
+    mode = st.radio("Select by:", ["Box", "Polygon"], horizontal=True, key="area_mode")
+    if mode == "Box":
+        col1, col2 = st.columns(2)
+        with col1:
+            lat_range = st.slider("Latitude:", lat_min, lat_max, (lat_min, lat_max), step=0.01, key="area_lat")
+        with col2:
+            lon_range = st.slider("Longitude:", lon_min, lon_max, (lon_min, lon_max), step=0.01, key="area_lon")
+        outline = ((lat_range[0], lon_range[0]), (lat_range[1], lon_range[0]),
+                   (lat_range[1], lon_range[1]), (lat_range[0], lon_range[1]))
+        selected = stations_in_box(lat_range[0], lat_range[1], lon_range[0], lon_range[1])
+    else:
+        text = st.text_area("Polygon corners (one \"latitude, longitude\" per line):", DEFAULT_POLYGON, key="area_polygon")
+        outline = parse_polygon(text)
+        if outline is None:
+            st.warning("Give at least three corners, each as two numbers separated by a comma.")
+            return
+        selected = stations_in_polygon(outline)
+
+    # Map of the stations with the selected ones highlighted, cached per area
+    fig3 = cached_figure(area_map_figure, samples_version(), mode, outline)
+    with timed("serialize", "area map"):
+        st.plotly_chart(fig3)
+
+    samples = int(selected["Samples"].sum())
+    st.markdown(f"**{len(selected)} stations** selected, with **{samples} samples**.")
+    if selected.empty:
+        return
 
+    # The selected stations straight into the Single View
+    labels = [f"{reference} | {station}" for reference, station in zip(selected["Reference"], selected["Station"])]
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        label = st.selectbox("Station:", labels, key="area_station")
+    with col2:
+        st.markdown("<br>", unsafe_allow_html=True)
+        reference, station = selected.iloc[labels.index(label)][["Reference", "Station"]]
+        st.button("Open in Single View", key="area_open", on_click=open_in_single_view, args=(reference, station))
 
+    # Samples of the selected stations in the paged table
+    rows = np.concatenate([sample_positions(reference, station)
+                           for reference, station in zip(selected["Reference"], selected["Station"])])
+    metadata = load_metadata().loc[rows, ["Reference", "Station", "Depth_in_core", "Water_depth", "TOC"]]
+    show_paged_table(metadata, rows, key="area_data")
+
+
+# Figure of the area map: every station, the selected ones in color and the
+# outline of the box or polygon
+def area_map_figure(mode, outline):
+    stations = load_station_index()["stations"]
+    if mode == "Box":
+        (lat_min, lon_min), _, (lat_max, lon_max), _ = outline
+        selected = stations_in_box(lat_min, lat_max, lon_min, lon_max)
+    else:
+        selected = stations_in_polygon(outline)
+    inside = stations.index.isin(selected.index)
+
+    fig3 = go.Figure()
+    fig3.add_trace(go.Scattermapbox(
+        lat=stations.loc[~inside, "Lat"], lon=stations.loc[~inside, "Long"], mode="markers",
+        marker=dict(size=8, color="#7f7f7f", opacity=0.5), name="Other stations",
+        hovertext=stations.loc[~inside, "Reference"] + " | " + stations.loc[~inside, "Station"].astype(str), hoverinfo="text",
+    ))
+    fig3.add_trace(go.Scattermapbox(
+        lat=stations.loc[inside, "Lat"], lon=stations.loc[inside, "Long"], mode="markers",
+        marker=dict(size=10, color="#ff7f0e"), name="Selected stations",
+        hovertext=stations.loc[inside, "Reference"] + " | " + stations.loc[inside, "Station"].astype(str), hoverinfo="text",
+    ))
+    corners = list(outline) + [outline[0]]
+    fig3.add_trace(go.Scattermapbox(
+        lat=[lat for lat, _ in corners], lon=[lon for _, lon in corners], mode="lines",
+        line=dict(width=2, color="#1f77b4"), name="Area", hoverinfo="skip",
+    ))
+    fig3.update_layout(
+        mapbox_style="open-street-map",
+        mapbox=dict(center=dict(lat=40.8, lon=28.5), zoom=7),
+        height=500,
+        margin={"r": 0, "t": 0, "l": 0, "b": 0},
+        legend=dict(x=0, y=1),
+    )
+    return fig3
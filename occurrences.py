@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+from abundance import DECIMALS
+from dataset import load_metadata
+from profiling import timed
+from taxonomy import LEVELS, level_abundance
+
+# Inverted index of the abundances: for every taxon, the postings (sample row,
+# relative abundance) of the samples where it was found, sorted from the most to
+# the least abundant. It is the CSC form of the abundance matrix, so it is built
+# with one conversion per dataset version and taxonomic level; "where is taxon X
+# above t %" is then one slice and one binary search.
+
+
+# Postings of every column of an abundance matrix (see abundance.py):
+# {"taxa", "columns", "indptr", "rows", "values"}, the postings of column j being
+# rows[indptr[j]:indptr[j + 1]] and values[indptr[j]:indptr[j + 1]]
+def build_postings(abundance):
+    matrix = abundance["matrix"].tocsc()
+    counts = np.diff(matrix.indptr)
+    columns = np.repeat(np.arange(matrix.shape[1]), counts)
+    # By column, then from the most to the least abundant (stable for equal values)
+    order = np.lexsort((-matrix.data, columns))
+    return {
+        "taxa": abundance["taxa"],
+        "columns": abundance["columns"],
+        "indptr": matrix.indptr.astype(np.int64),
+        "rows": matrix.indices[order].astype(np.int64),
+        "values": matrix.data[order],
+    }
+
+
+# Rows and abundances of the samples where the taxon is at least `threshold` %,
+# most abundant first
+def query_postings(postings, taxon, threshold=0.0):
+    column = postings["columns"].get(taxon)
+    if column is None:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+    start, end = postings["indptr"][column], postings["indptr"][column + 1]
+    values = postings["values"][start:end]
+    # Values are sorted in decreasing order: the matches are a prefix of the slice
+    count = np.searchsorted(-values, -np.float32(threshold), side="right")
+    return postings["rows"][start:start + count], values[:count]
+
+
+@st.cache_resource(max_entries=len(LEVELS), show_spinner=False)
+def _build_postings(data_hash, _abundance):
+    return build_postings(_abundance)
+
+
+# Inverted index of the abundances at a taxonomic level, built once per dataset version
+def load_postings(level="Taxon"):
+    abundance = level_abundance(level)
+    with timed("load", "taxon postings"):
+        return _build_postings(abundance["hash"], abundance)
+
+
+# Samples where a taxon occurs at or above `threshold` %, with their metadata and
+# the abundance of the taxon, most abundant first
+def taxon_occurrences(taxon, threshold=0.0, level="Taxon"):
+    postings = load_postings(level)
+    with timed("filter", "taxon occurrences"):
+        rows, values = query_postings(postings, taxon, threshold)
+        occurrences = load_metadata().loc[rows, ["Reference", "Station", "Depth_in_core", "Water_depth", "Lat", "Long"]]
+        occurrences["Relative Abundance"] = np.round(values.astype(np.float64), DECIMALS)
+        return occurrences
+
+
+# Number of samples of every taxon, for the options of the search
+def taxon_sample_counts(level="Taxon"):
+    postings = load_postings(level)
+    return pd.Series(np.diff(postings["indptr"]), index=postings["taxa"])
@@ -0,0 +1,191 @@
+import cProfile
+import importlib
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+import pandas as pd
+import streamlit as st
+
+# Start of the process, as close as possible: app.py imports this module first
+PROCESS_START = time.perf_counter()
+
+# Startup instrumentation, enabled with APP_STARTUP_TIMING=1. It records the import
+# time of every page module and the time to first paint of every page, logs them
+# and shows them in the sidebar against the startup budget (in seconds, set with
+# APP_STARTUP_BUDGET).
+STARTUP_TIMING = os.environ.get("APP_STARTUP_TIMING", "") not in ("", "0")
+STARTUP_BUDGET = float(os.environ.get("APP_STARTUP_BUDGET", "3.0"))
+
+logger = logging.getLogger("startup")
+if STARTUP_TIMING and not logger.handlers:
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(levelname)s: %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+# Hot-path profiling, enabled for every session with APP_PROFILE=1 or for one
+# session with the ?profile=1 query parameter. Data loading, filtering, figure
+# construction and figure serialization are timed with `timed()` inside the pages;
+# the timings of each rerun are shown in a sidebar panel and logged as one JSON
+# line. The panel can also capture a cProfile dump of the next rerun to PROFILE_DIR.
+PROFILE_ENV = os.environ.get("APP_PROFILE", "") not in ("", "0")
+PROFILE_DIR = os.environ.get("APP_PROFILE_DIR", "profiles")
+
+# Stages of the hot path, in the order they are shown
+STAGES = ["load", "filter", "figure", "serialize"]
+
+profile_logger = logging.getLogger("profile")
+if PROFILE_ENV and not profile_logger.handlers:
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    profile_logger.addHandler(handler)
+    profile_logger.setLevel(logging.INFO)
+
+# Timings of the rerun running in the current thread (each session runs its script
+# in its own thread): (stage, name) -> [calls, seconds], or None when not profiling
+_rerun = threading.local()
+
+# Process-wide timings: module -> import seconds, page -> seconds of its first render
+import_times = {}
+paint_times = {}
+
+
+# Import a page module the first time it is needed and record how long it took.
+# Modules already imported (e.g. by another page) cost nothing and are not recorded.
+def load_module(name):
+    if name in sys.modules:
+        return sys.modules[name]
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    import_times[name] = time.perf_counter() - start
+    if STARTUP_TIMING:
+        logger.info("import %s: %.0f ms", name, import_times[name] * 1000)
+    return module
+
+
+def profiling_enabled():
+    return PROFILE_ENV or st.experimental_get_query_params().get("profile", ["0"])[0] not in ("", "0")
+
+
+# Time a block of a page as one step of a stage ("load", "filter", "figure" or
+# "serialize"). Costs nothing when profiling is off.
+@contextmanager
+def timed(stage, name):
+    timings = getattr(_rerun, "timings", None)
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        entry = timings.setdefault((stage, name), [0, 0.0])
+        entry[0] += 1
+        entry[1] += time.perf_counter() - start
+
+
+# Render a page and, the first time it is shown in this process, record its time to
+# first paint: the time from the start of the rerun to the end of its first render,
+# lazy imports and data loading included. The first page of the process also
+# reports the time since the process started.
+def render_page(name, show, run_start):
+    _rerun.timings = {} if profiling_enabled() else None
+    if _rerun.timings is not None and st.session_state.pop("capture_cprofile", False):
+        profiler = cProfile.Profile()
+        profiler.runcall(show)
+        save_cprofile(profiler, name)
+    else:
+        show()
+    if _rerun.timings is not None:
+        log_profile(name, time.perf_counter() - run_start)
+
+    if name in paint_times:
+        return
+    paint_times[name] = time.perf_counter() - run_start
+    if STARTUP_TIMING:
+        since_start = "" if len(paint_times) > 1 else f" ({time.perf_counter() - PROCESS_START:.2f} s after process start)"
+        logger.info("first paint %s: %.0f ms%s", name, paint_times[name] * 1000, since_start)
+        if paint_times[name] > STARTUP_BUDGET:
+            logger.warning("first paint of %s is over the startup budget of %.1f s", name, STARTUP_BUDGET)
+
+
+# Sidebar report of the startup timings
+def show_startup_report():
+    if not STARTUP_TIMING:
+        return
+    with st.sidebar.expander("Startup timings", expanded=True):
+        st.write(f"Budget: **{STARTUP_BUDGET:.1f} s** to first paint")
+        if import_times:
+            st.table(pd.DataFrame(
+                {"Import (ms)": [round(seconds * 1000) for seconds in import_times.values()]},
+                index=list(import_times),
+            ))
+        if paint_times:
+            st.table(pd.DataFrame(
+                {
+                    "First paint (ms)": [round(seconds * 1000) for seconds in paint_times.values()],
+                    "Within budget": [seconds <= STARTUP_BUDGET for seconds in paint_times.values()],
+                },
+                index=list(paint_times),
+            ))
+
+
+# Write a cProfile dump of the rerun and keep a summary for the panel
+def save_cprofile(profiler, page):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(PROFILE_DIR, f"{stamp}-{page.lower().replace(' ', '_')}.prof")
+    profiler.dump_stats(path)
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(25)
+    st.session_state["last_cprofile"] = {"path": path, "summary": summary.getvalue()}
+
+
+def log_profile(page, seconds):
+    _rerun.total = seconds
+    profile_logger.info(json.dumps({
+        "event": "rerun",
+        "page": page,
+        "total_ms": round(seconds * 1000, 1),
+        "timings": [
+            {"stage": stage, "name": name, "calls": calls, "ms": round(elapsed * 1000, 1)}
+            for (stage, name), (calls, elapsed) in _rerun.timings.items()
+        ],
+    }))
+
+
+def request_cprofile():
+    st.session_state["capture_cprofile"] = True
+
+
+# Sidebar panel with the timings of this rerun, by stage
+def show_profile_panel():
+    timings = getattr(_rerun, "timings", None)
+    if timings is None:
+        return
+    with st.sidebar.expander("Profile of this rerun", expanded=True):
+        st.write(f"Rerun: **{_rerun.total * 1000:.0f} ms**")
+        if timings:
+            table = pd.DataFrame(
+                [(stage, name, calls, round(elapsed * 1000, 1)) for (stage, name), (calls, elapsed) in timings.items()],
+                columns=["Stage", "Step", "Calls", "ms"],
+            )
+            table["Stage"] = pd.Categorical(table["Stage"], categories=STAGES, ordered=True)
+            totals = table.groupby("Stage", observed=True)["ms"].sum()
+            st.write(" · ".join(f"{stage} {ms:.0f} ms" for stage, ms in totals.items()))
+            st.dataframe(table.sort_values(["Stage", "ms"], ascending=[True, False]), hide_index=True)
+            st.caption("Steps can be nested, e.g. data loaded while a figure is built is counted in both.")
+
+        # The callback runs before the rerun triggered by the click, so that rerun is profiled
+        st.button("Capture a cProfile of a rerun", key="capture_cprofile_button", on_click=request_cprofile)
+        last = st.session_state.get("last_cprofile")
+        if last:
+            st.caption(f"Last dump: {last['path']}")
+            st.text(last["summary"])
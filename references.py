@@ -1,6 +1,7 @@
 import streamlit as st
-import pandas as pd
-from analysis import add_footer
+from footer import add_footer
+from dataset import load_references
+from exports import BUNDLE_NAME, bundle_export, bundle_prebuilt, source_file
 
 def show_references():
     # Title for the references section
@@ -13,8 +14,8 @@ def show_references():
 
     # Load the references from the CSV file
     try:
-        # Path to your references CSV file
-        references_df = pd.read_csv('data/references.csv')
+        # Cached references from the CSV file
+        references_df = load_references()
 
         # Check if the CSV loaded correctly
         if references_df.empty:
@@ -40,16 +41,12 @@ def show_references():
         "<h2 style='font-size: 18px;'>Supplementary Material</h2>",
         unsafe_allow_html=True
     )
-    # Filepath to the Excel file
-    file_path = "./data/taxa.xlsx"
-
-    # Offer the file as a downloadable button
-    with open(file_path, "rb") as file:
-        st.download_button(
-            label="📥 Download Taxa Excel File",
-            data=file,
-            file_name="taxa.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    # Offer the file as a downloadable button, read once per version of the file
+    st.download_button(
+        label="📥 Download Taxa Excel File",
+        data=source_file("taxa"),
+        file_name="taxa.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     )
 
 # Add an explanation
@@ -67,6 +64,25 @@ def show_references():
         unsafe_allow_html=True
         )
 
+    # The whole data set in one archive. A prebuilt archive is served as it is;
+    # otherwise it is only encoded (once per process) when asked for.
+    if bundle_prebuilt() or st.button("Build the Complete Data Set archive", key="build_bundle"):
+        st.download_button(
+            label="📥 Download the Complete Data Set (zip)",
+            data=bundle_export(),
+            file_name=BUNDLE_NAME,
+            mime="application/zip"
+        )
+    st.markdown(
+        """
+        <p style='font-size: 14px;'>
+        The archive holds the relative abundances of all samples (CSV and Parquet), the table of every reference
+        and the cluster, reference and taxa files.
+        </p>
+        """,
+        unsafe_allow_html=True
+        )
+
 #empty spaces
     st.markdown("<br><br>", unsafe_allow_html=True)
     st.write("------")
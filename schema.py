@@ -0,0 +1,75 @@
+import pandas as pd
+
+# Schema of the samples data (gamze2.xlsx and the added studies). The metadata
+# columns are listed here with their type, set once when the samples are loaded
+# (see dataset.split_samples); every other column is a taxon, kept in the sparse
+# float32 abundance matrix (see abundance.py). Text columns with few distinct values
+# are categorical. TOC and N are numbers written as "-" in the source files for the
+# samples where they were not measured: they are read as nullable numbers, with NA
+# for the "-", and written back as "-" wherever they are shown or exported.
+
+# Placeholder of a missing value in the source files
+MISSING = "-"
+
+# Metadata column -> dtype, in the order of the samples file
+METADATA_DTYPES = {
+    "Code": "category",
+    "Reference": "category",
+    "Type": "category",
+    "Station": "category",
+    "Depth_in_core": "float64",
+    "Lat": "float64",
+    "Long": "float64",
+    "Water_depth": "float64",
+    "TOC": "Float64",
+    "L/D/U": "category",
+    "Size_fraction": "int16",
+    "S": "int32",
+    "N": "Int32",
+}
+
+METADATA_COLUMNS = list(METADATA_DTYPES)
+
+# Columns that may be missing ("-" in the source files)
+OPTIONAL_COLUMNS = ["TOC", "N"]
+
+# Metadata columns shown next to the taxa in the tables of the samples
+TABLE_COLUMNS = ["Station", "Depth_in_core", "Water_depth", "TOC"]
+
+
+# Taxon columns of a samples frame: all but the metadata and the unnamed helper
+# columns (e.g. the row total in 'Unnamed: 450')
+def taxon_columns(columns):
+    return [column for column in columns if column not in METADATA_DTYPES and not str(column).startswith("Unnamed")]
+
+
+# Metadata frame with the types of the schema. Text is stripped (e.g. the Type
+# "C " of some rows) and "-" is read as NA in the optional columns.
+def typed_metadata(data):
+    typed = {}
+    for column, dtype in METADATA_DTYPES.items():
+        values = data[column]
+        if dtype == "category":
+            typed[column] = values.astype("string").str.strip().astype("category")
+        else:
+            if column in OPTIONAL_COLUMNS and not pd.api.types.is_numeric_dtype(values):
+                values = pd.to_numeric(values.astype("string").str.strip().replace(MISSING, pd.NA), errors="coerce")
+            typed[column] = values.astype(dtype)
+    return pd.DataFrame(typed, index=data.index)
+
+
+# Optional columns of a frame as text with "-" for the missing values, for figures
+# and tables that show the values as they are written in the publications
+def with_missing_marks(data):
+    columns = [column for column in OPTIONAL_COLUMNS if column in data.columns]
+    if not columns:
+        return data
+    return data.assign(**{column: data[column].astype("string").fillna(MISSING) for column in columns})
+
+
+# Frame of a selection of rows without the categories of the other rows, so that
+# grouping by a categorical column (e.g. the traces of a plotly express color)
+# only sees the values of the selection
+def drop_unused_categories(data):
+    columns = [column for column, dtype in METADATA_DTYPES.items() if dtype == "category" and column in data.columns]
+    return data.assign(**{column: data[column].cat.remove_unused_categories() for column in columns})
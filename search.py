@@ -0,0 +1,139 @@
+import streamlit as st
+import plotly.graph_objects as go
+from caching import cached_figure
+from footer import add_footer
+from occurrences import taxon_occurrences, taxon_sample_counts
+from profiling import timed
+from spatial import load_station_index
+from taxonomy import LEVELS, level_version, load_taxonomy, resolve_taxon, taxon_labels
+
+
+# Open a sample of the results in the Single View (runs before the rerun, so the
+# widgets of the Single View are created with these values)
+def open_sample(reference, station, depth):
+    st.session_state["page"] = "Single View"
+    st.session_state["single_view_reference"] = reference
+    st.session_state["single_view_station"] = station
+    st.session_state["single_view_depth"] = depth
+
+
+# Taxon Search page: the samples where a taxon occurs above a threshold, answered
+# from the inverted index of the abundances (see occurrences.py)
+def show_taxon_search():
+    st.title("Taxon Search")
+    st.markdown(
+        """
+        <div style="text-align: justify; font-size: 14px;">
+        Find the stations and depths in core where a taxon was found. Type in the box to search the taxa,
+        or give a name used in one of the studies to find the taxon it is listed under.
+        </div>
+        """, unsafe_allow_html=True
+    )
+
+    st.markdown(
+        """
+        <h3 style=" font-size: 22px;">Step 1</h3>
+        """, unsafe_allow_html=True
+    )
+    level = st.radio("Taxonomic level:", LEVELS, horizontal=True, key="taxon_search_level")
+    counts = taxon_sample_counts(level)
+    options = sorted(counts.index, key=str.lower)
+
+    # Names of the studies and synonyms, resolved with the taxa list (see taxonomy.py)
+    name = st.text_input("Name used in a study (optional):", key="taxon_search_name").strip()
+    taxon = None
+    if name:
+        code = resolve_taxon(name)
+        if code is None:
+            st.warning(f"'{name}' is not in the taxa list.")
+        else:
+            taxon = code if level == "Taxon" else taxon_labels([code], level)[0]
+            accepted = load_taxonomy()["accepted"].get(code, code)
+            st.write(f"'{name}' is listed as **{code.replace('_', ' ')}** (accepted name: *{accepted}*).")
+    if taxon not in counts.index:
+        # The selectbox filters its options as the user types
+        labels = [f"{option.replace('_', ' ')} ({counts[option]} samples)" for option in options]
+        taxon = options[labels.index(st.selectbox("Choose a taxon:", labels, key="taxon_search_taxon"))]
+
+    st.markdown(
+        """
+        <h3 style=" font-size: 22px;">Step 2</h3>
+        """, unsafe_allow_html=True
+    )
+    threshold = st.slider(
+        "Minimum relative abundance (%):", 0.0, 100.0, 0.0, step=0.5, key="taxon_search_threshold"
+    )
+
+    occurrences = taxon_occurrences(taxon, threshold, level)
+    stations = occurrences.groupby(["Reference", "Station"], sort=False, observed=True).ngroups
+    references = occurrences["Reference"].nunique()
+    st.markdown(
+        f"**{taxon.replace('_', ' ')}** is found at or above {threshold:g}% in **{len(occurrences)} samples** "
+        f"at {stations} stations of {references} references."
+    )
+    if occurrences.empty:
+        add_footer()
+        return
+
+    # One marker per station, sized and colored by the largest abundance of its samples
+    fig = cached_figure(occurrence_map_figure, level_version(level), level, taxon, threshold)
+    with timed("serialize", "occurrence map"):
+        st.plotly_chart(fig)
+
+    st.dataframe(
+        occurrences[["Reference", "Station", "Depth_in_core", "Water_depth", "Relative Abundance"]]
+        .style.format({"Relative Abundance": "{:.2f}", "Depth_in_core": "{:g}", "Water_depth": "{:g}"}),
+        hide_index=True,
+    )
+
+    # The samples of the results straight into the Single View
+    labels = [f"{reference} | {station} | {depth:g} cm" for reference, station, depth
+              in zip(occurrences["Reference"], occurrences["Station"], occurrences["Depth_in_core"])]
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        label = st.selectbox("Sample:", labels, key="taxon_search_sample")
+    with col2:
+        st.markdown("<br>", unsafe_allow_html=True)
+        reference, station, depth = occurrences.iloc[labels.index(label)][["Reference", "Station", "Depth_in_core"]]
+        st.button("Open in Single View", key="taxon_search_open", on_click=open_sample, args=(reference, station, depth))
+
+    add_footer()
+
+
+# Map of the stations where a taxon occurs at or above `threshold` %, over the other stations
+def occurrence_map_figure(level, taxon, threshold):
+    occurrences = taxon_occurrences(taxon, threshold, level)
+    found = occurrences.groupby(["Reference", "Station"], sort=False, observed=True).agg(
+        Lat=("Lat", "first"), Long=("Long", "first"),
+        Maximum=("Relative Abundance", "max"), Samples=("Relative Abundance", "size"),
+    ).reset_index()
+    stations = load_station_index()["stations"]
+    others = stations.merge(found[["Reference", "Station"]], how="left", indicator=True)
+    others = others[others["_merge"] == "left_only"]
+
+    fig = go.Figure()
+    fig.add_trace(go.Scattermapbox(
+        lat=others["Lat"], lon=others["Long"], mode="markers",
+        marker=dict(size=6, color="#7f7f7f", opacity=0.4), name="Other stations",
+        hovertext=others["Reference"] + " | " + others["Station"].astype(str), hoverinfo="text",
+    ))
+    fig.add_trace(go.Scattermapbox(
+        lat=found["Lat"], lon=found["Long"], mode="markers",
+        marker=dict(
+            size=8 + 22 * found["Maximum"] / max(found["Maximum"].max(), 1e-9),
+            color=found["Maximum"], colorscale="Viridis", showscale=True,
+            colorbar=dict(title="Max. (%)"),
+        ),
+        name="Stations with the taxon",
+        hovertext=(found["Reference"].astype(str) + " | " + found["Station"].astype(str) + "<br>max. "
+                   + found["Maximum"].round(2).astype(str) + "% in " + found["Samples"].astype(str) + " samples"),
+        hoverinfo="text",
+    ))
+    fig.update_layout(
+        mapbox_style="open-street-map",
+        mapbox=dict(center=dict(lat=40.8, lon=28.5), zoom=7),
+        height=500,
+        margin={"r": 0, "t": 0, "l": 0, "b": 0},
+        showlegend=False,
+    )
+    return fig
@@ -0,0 +1,229 @@
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import streamlit as st
+from scipy.cluster import hierarchy
+from scipy.spatial.distance import squareform
+from dataset import load_abundance, load_metadata, samples_version
+
+# Cluster analysis of the stations as in the thesis: Bray-Curtis dissimilarity
+# between the surface samples and UPGMA (average linkage) clustering. Results are
+# cached by the content hash of the abundance matrix, so the distances and the
+# linkage are computed once per version of the data; cutting the tree at another
+# height only re-labels the leaves.
+
+# Number of leaves above which the dendrogram only shows its top branches
+MAX_DENDROGRAM_LEAVES = 150
+
+# Colors of the clusters, in the dendrogram and on the map
+CLUSTER_COLORS = px.colors.qualitative.Dark24
+
+
+# Dissimilarities offered for the similar-samples search
+METRICS = ["Bray-Curtis", "Jaccard", "Euclidean"]
+
+# Nearest neighbours kept per sample in the neighbour table, and the number of
+# samples whose distances are computed at once while building it
+MAX_NEIGHBOURS = 50
+BLOCK_ROWS = 256
+
+
+# Dissimilarities between the samples at positions `rows` and all samples of a
+# sparse samples x taxa matrix, as a dense len(rows) x n array. `columns` is the
+# same matrix in CSC format.
+#   Bray-Curtis: 1 - 2 * sum_t min(x_it, x_jt) / (sum_t x_it + sum_t x_jt)
+#   Jaccard: 1 - shared taxa / taxa present in either sample
+#   Euclidean: distance between the abundance vectors
+# The Bray-Curtis shared abundances sum_t min(x_it, x_jt) only get contributions
+# from taxa present in both samples, so they are accumulated taxon by taxon over
+# the samples where the taxon occurs; the work grows with the number of nonzero
+# pairs instead of samples^2 x taxa. Two empty samples (0 / 0) count as identical.
+def distance_block(matrix, columns, rows, metric="Bray-Curtis"):
+    rows = np.asarray(rows)
+    if metric == "Bray-Curtis":
+        position = np.full(matrix.shape[0], -1)
+        position[rows] = np.arange(len(rows))
+        shared = np.zeros((len(rows), matrix.shape[0]))
+        for j in range(columns.shape[1]):
+            start, end = columns.indptr[j], columns.indptr[j + 1]
+            samples = columns.indices[start:end]
+            in_block = position[samples] >= 0
+            if in_block.any():
+                values = columns.data[start:end].astype(np.float64)
+                shared[np.ix_(position[samples[in_block]], samples)] += np.minimum.outer(values[in_block], values)
+        totals = np.asarray(matrix.sum(axis=1, dtype=np.float64)).ravel()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            distances = 1 - 2 * shared / (totals[rows, None] + totals[None, :])
+    elif metric == "Jaccard":
+        present = (matrix > 0).astype(np.float64)
+        shared = (present[rows] @ present.T).toarray()
+        counts = np.asarray(present.sum(axis=1)).ravel()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            distances = 1 - shared / (counts[rows, None] + counts[None, :] - shared)
+    elif metric == "Euclidean":
+        matrix = matrix.astype(np.float64)
+        squares = np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel()
+        products = (matrix[rows] @ matrix.T).toarray()
+        distances = np.sqrt(np.maximum(squares[rows, None] + squares[None, :] - 2 * products, 0))
+    else:
+        raise ValueError(f"Unknown dissimilarity: {metric}")
+    return np.nan_to_num(distances, nan=0.0)
+
+
+# Pairwise Bray-Curtis dissimilarities between the rows of a sparse samples x taxa
+# matrix, in condensed form (see scipy.spatial.distance.squareform)
+def bray_curtis(matrix):
+    distances = distance_block(matrix, matrix.tocsc(), np.arange(matrix.shape[0]))
+    np.fill_diagonal(distances, 0)
+    return squareform(distances, checks=False)
+
+
+# Row positions of the surface sample (shallowest Depth_in_core) of every station
+def surface_rows(metadata):
+    depths = metadata[['Reference', 'Station', 'Depth_in_core']]
+    first = depths.sort_values('Depth_in_core', kind='stable').groupby(['Reference', 'Station'], sort=False, observed=True).head(1)
+    return np.sort(first.index.to_numpy())
+
+
+# Short station label like in the published dendrogram: study number and station
+def station_labels(metadata):
+    codes = metadata['Code'].astype(str).str.replace('SoM_', '', regex=False)
+    return (codes + '_' + metadata['Station'].astype(str)).to_numpy()
+
+
+@st.cache_resource(max_entries=2, show_spinner="Clustering the stations...")
+def _cluster_surface_samples(version, _metadata, _abundance):
+    rows = surface_rows(_metadata)
+    distances = bray_curtis(_abundance["matrix"][rows])
+    linkage = hierarchy.linkage(distances, method="average")  # UPGMA
+    return {
+        "rows": rows,
+        "labels": station_labels(_metadata.iloc[rows]),
+        "distances": distances,
+        "linkage": linkage,
+    }
+
+
+# Version of the surface clustering: the samples and labels come from the
+# metadata, the distances from the abundances
+def clustering_version():
+    return samples_version(), load_abundance()["hash"]
+
+
+# Bray-Curtis distances and UPGMA linkage of the surface samples of all stations
+def load_surface_clustering():
+    return _cluster_surface_samples(clustering_version(), load_metadata(), load_abundance())
+
+
+# Cluster of every clustered sample when the tree is cut at a Bray-Curtis
+# similarity (%). Clusters are numbered C1, C2, ... from left to right in the
+# dendrogram.
+def cut_clusters(clustering, similarity):
+    linkage = clustering["linkage"]
+    ids = hierarchy.fcluster(linkage, t=1 - similarity / 100, criterion="distance")
+    leaf_ids = ids[hierarchy.leaves_list(linkage)]
+    _, first = np.unique(leaf_ids, return_index=True)
+    numbering = {cluster: k + 1 for k, cluster in enumerate(leaf_ids[np.sort(first)])}
+    return np.array([f"C{numbering[cluster]}" for cluster in ids], dtype=object)
+
+
+# Dendrogram of the clustering with the similarity (%) axis of PAST and the cut
+# line. Branches below the cut are colored by cluster.
+def dendrogram_figure(clustering, similarity):
+    cut = 1 - similarity / 100
+    truncate = len(clustering["labels"]) > MAX_DENDROGRAM_LEAVES
+    tree = hierarchy.dendrogram(
+        clustering["linkage"],
+        labels=list(clustering["labels"]),
+        color_threshold=cut,
+        above_threshold_color="#7f7f7f",
+        truncate_mode="lastp" if truncate else None,
+        p=MAX_DENDROGRAM_LEAVES,
+        no_plot=True,
+    )
+
+    # One trace per color, the branches separated by gaps (None). Scipy names the
+    # cluster colors "C1", "C2", ... (matplotlib color cycle).
+    segments = {}
+    for xs, ys, color in zip(tree["icoord"], tree["dcoord"], tree["color_list"]):
+        if color[0] == "C" and color[1:].isdigit():
+            color = CLUSTER_COLORS[int(color[1:]) % len(CLUSTER_COLORS)]
+        x_values, y_values = segments.setdefault(color, ([], []))
+        x_values.extend(xs + [None])
+        y_values.extend([(1 - y) * 100 for y in ys] + [None])
+
+    fig = go.Figure()
+    for color, (x_values, y_values) in segments.items():
+        fig.add_trace(go.Scatter(x=x_values, y=y_values, mode="lines", line=dict(color=color, width=1),
+                                 hoverinfo="skip", showlegend=False))
+    fig.add_hline(y=similarity, line=dict(color="red", dash="dash", width=1),
+                  annotation_text=f"cut at {similarity:.0f}% similarity", annotation_position="bottom right")
+
+    leaf_positions = 5 + 10 * np.arange(len(tree["ivl"]))
+    fig.update_layout(
+        height=500,
+        margin=dict(l=10, r=10, t=30, b=10),
+        xaxis=dict(tickmode="array", tickvals=leaf_positions, ticktext=tree["ivl"],
+                   tickfont=dict(size=7), tickangle=-90, showgrid=False, zeroline=False),
+        yaxis=dict(title="Similarity (%)", range=[101, 0]),  # Leaves (100%) at the bottom
+        plot_bgcolor="white",
+    )
+    return fig
+
+
+# Surface samples with the cluster they fall in at the given similarity cut
+def clustered_samples(clustering, similarity):
+    samples = load_metadata().iloc[clustering["rows"]].copy()
+    clusters = cut_clusters(clustering, similarity)
+    order = sorted(set(clusters), key=lambda name: int(name[1:]))  # C1, C2, ..., C10
+    samples['Cluster'] = pd.Categorical(clusters, categories=order)
+    samples['Label'] = clustering["labels"]
+    return samples
+
+
+# Table of the nearest neighbours of every sample for a dissimilarity, built block
+# by block so that only BLOCK_ROWS x samples distances are held at a time:
+# "neighbours" and "distances" are samples x MAX_NEIGHBOURS arrays sorted from the
+# nearest to the farthest neighbour.
+@st.cache_resource(max_entries=len(METRICS), show_spinner="Indexing similar samples...")
+def _build_neighbour_table(data_hash, metric, _abundance):
+    matrix = _abundance["matrix"]
+    columns = matrix.tocsc()
+    n = matrix.shape[0]
+    k = min(MAX_NEIGHBOURS, n - 1)
+    neighbours = np.zeros((n, k), dtype=np.int32)
+    distances = np.zeros((n, k), dtype=np.float32)
+    for start in range(0, n, BLOCK_ROWS):
+        rows = np.arange(start, min(start + BLOCK_ROWS, n))
+        block = distance_block(matrix, columns, rows, metric)
+        block[np.arange(len(rows)), rows] = np.inf  # A sample is not its own neighbour
+        nearest = np.argpartition(block, k - 1, axis=1)[:, :k]
+        nearest_distances = np.take_along_axis(block, nearest, axis=1)
+        order = np.argsort(nearest_distances, axis=1, kind='stable')
+        neighbours[rows] = np.take_along_axis(nearest, order, axis=1)
+        distances[rows] = np.take_along_axis(nearest_distances, order, axis=1)
+    return {"neighbours": neighbours, "distances": distances}
+
+
+def load_neighbour_table(metric):
+    abundance = load_abundance()
+    return _build_neighbour_table(abundance["hash"], metric, abundance)
+
+
+# The k samples most similar to the sample at position `row`, as metadata rows
+# with their dissimilarity, nearest first. With exclude_station, samples of the
+# same reference and station are skipped (so fewer than k may be returned).
+def similar_samples(row, metric="Bray-Curtis", k=10, exclude_station=False):
+    table = load_neighbour_table(metric)
+    metadata = load_metadata()
+    neighbours = table["neighbours"][row]
+    distances = table["distances"][row].astype(float)
+    if exclude_station:
+        sample = metadata.iloc[row]
+        candidates = metadata.iloc[neighbours]
+        other = ((candidates['Reference'] != sample['Reference']) | (candidates['Station'] != sample['Station'])).to_numpy(dtype=bool)
+        neighbours, distances = neighbours[other], distances[other]
+    result = metadata.iloc[neighbours[:k]].copy()
+    result['Dissimilarity'] = distances[:k]
+    return result
@@ -0,0 +1,289 @@
+import html
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+from markdown_it import MarkdownIt
+from plotly.offline import get_plotlyjs
+from streamlit.type_util import bytes_to_data_frame
+from dataset import sample_options
+from exports import data_hash, slug
+from headless import HeadlessRunner, install_runtime
+
+# Static snapshot of the app: every page, and the Single View of every
+# Reference/Station/Depth combination, rendered once with the headless script
+# runner and written as self-contained HTML files (Plotly figures embedded as
+# JSON, plotly.js and downloads copied next to them). The snapshot can be served
+# by a CDN or any file server; the Streamlit server is only needed for the
+# interactions that are not in it.
+
+SITE_DIR = "site"
+
+# Pages of the snapshot: page in the app -> file
+PAGE_FILES = {
+    "Home": "index.html",
+    "Maps": "maps.html",
+    "Single View": "single-view/index.html",
+    "Taxon Search": "taxon-search.html",
+    "Similarity of Sites": "similarity.html",
+    "References": "references.html",
+}
+
+PAGE_STYLE = """
+body { font-family: "Source Sans Pro", sans-serif; color: #31333f; margin: 0; }
+nav { background: #f0f2f6; padding: 12px 24px; font-size: 15px; }
+nav a { margin-right: 18px; color: #31333f; text-decoration: none; }
+nav a.current { font-weight: bold; }
+main { max-width: 730px; margin: 0 auto; padding: 24px 16px 48px; }
+.columns { display: flex; gap: 16px; }
+.widget { font-size: 14px; margin: 8px 0; }
+.widget .label { color: #808495; margin-right: 6px; }
+.caption { font-size: 12px; color: #808495; }
+.alert { padding: 12px 16px; border-radius: 6px; background: #f0f2f6; }
+.alert.error { background: #ffe2e2; } .alert.warning { background: #fff8d6; }
+.table-wrapper { overflow-x: auto; max-height: 420px; margin: 8px 0; }
+table.dataframe { border-collapse: collapse; font-size: 12px; }
+table.dataframe th, table.dataframe td { border: 1px solid #e6e9ef; padding: 2px 6px; white-space: nowrap; }
+footer.snapshot { font-size: 11px; color: #808495; text-align: center; margin-top: 24px; }
+"""
+
+markdown = MarkdownIt("commonmark", {"html": True}).enable("table").enable("strikethrough")
+
+
+# Path of the Single View page of a sample, e.g. single-view/Alavi_1988/A1/0_5.html
+def sample_file(reference, station, depth):
+    return f"single-view/{slug(reference)}/{slug(str(station))}/{slug(f'{depth:g}')}.html"
+
+
+# Relative path from one file of the site to another
+def link(from_file, to_file):
+    return os.path.relpath(to_file, os.path.dirname(from_file) or ".").replace(os.sep, "/")
+
+
+# Render the delta messages of a rerun as HTML. Widgets show their current value,
+# the sidebar and buttons are left out.
+class DeltaRenderer:
+    def __init__(self, runner, media_storage, site_dir, file):
+        self.session_state = runner.session_state
+        self.media_storage = media_storage
+        self.site_dir = site_dir
+        self.file = file
+        self.charts = 0
+        self.nodes = {}
+        for msg in runner.forward_msgs():
+            if msg.HasField("delta"):
+                delta = msg.delta
+                kind = delta.WhichOneof("type")
+                if kind in ("new_element", "add_block"):
+                    self.nodes[tuple(msg.metadata.delta_path)] = getattr(delta, kind)
+
+    def render(self):
+        return self.render_children((0,))  # The main container
+
+    def render_children(self, path):
+        children = sorted(
+            (child for child in self.nodes if len(child) == len(path) + 1 and child[:len(path)] == path),
+            key=lambda child: child[-1],
+        )
+        return "\n".join(self.render_node(child) for child in children)
+
+    def render_node(self, path):
+        node = self.nodes[path]
+        if hasattr(node, "allow_empty"):  # Block
+            inner = self.render_children(path)
+            kind = node.WhichOneof("type")
+            if kind == "horizontal":
+                return f'<div class="columns">{inner}</div>'
+            if kind == "column":
+                return f'<div style="flex: {node.column.weight or 1};">{inner}</div>'
+            if kind == "expandable":
+                return f"<details><summary>{html.escape(node.expandable.label)}</summary>{inner}</details>"
+            return f"<div>{inner}</div>"
+        return self.render_element(node)
+
+    def render_element(self, element):
+        kind = element.WhichOneof("type")
+        proto = getattr(element, kind)
+        if kind == "markdown":
+            if proto.element_type == proto.Type.DIVIDER:
+                return "<hr>"
+            if proto.element_type == proto.Type.CAPTION:
+                return f'<div class="caption">{markdown.render(proto.body)}</div>'
+            return markdown.render(proto.body)
+        if kind == "heading":
+            return f"<{proto.tag}>{markdown.renderInline(proto.body)}</{proto.tag}>"
+        if kind == "text":
+            return f"<pre>{html.escape(proto.body)}</pre>"
+        if kind == "alert":
+            level = proto.Format.Name(proto.format).lower()
+            return f'<div class="alert {level}">{markdown.render(proto.body)}</div>'
+        if kind in ("arrow_data_frame", "arrow_table"):
+            return self.render_table(proto)
+        if kind == "plotly_chart":
+            return self.render_chart(proto)
+        if kind == "imgs":
+            return "".join(
+                f'<img src="{self.media_link(image.url)}" alt="{html.escape(image.caption)}"'
+                + (f' width="{proto.width}"' if proto.width > 0 else ' style="max-width: 100%;"') + ">"
+                for image in proto.imgs
+            )
+        if kind == "download_button":
+            return f'<p><a href="{self.media_link(proto.url)}" download>{html.escape(proto.label)}</a></p>'
+        if kind in ("selectbox", "radio", "multiselect", "slider", "checkbox", "number_input", "text_input"):
+            return self.render_widget(proto)
+        if kind == "exception":
+            return f"<pre>{html.escape(proto.type)}: {html.escape(proto.message)}</pre>"
+        return ""  # Buttons, spinners and empty placeholders
+
+    def render_widget(self, proto):
+        try:
+            value = self.session_state[proto.id]
+        except KeyError:
+            return ""
+        if isinstance(value, (list, tuple)):
+            value = ", ".join(str(item) for item in value)
+        elif isinstance(value, bool):
+            value = "yes" if value else "no"
+        return f'<div class="widget"><span class="label">{html.escape(proto.label)}</span>{html.escape(str(value))}</div>'
+
+    def render_table(self, proto):
+        if proto.HasField("styler") and proto.styler.display_values:
+            table = bytes_to_data_frame(proto.styler.display_values)
+        else:
+            table = bytes_to_data_frame(proto.data)
+        return f'<div class="table-wrapper">{table.to_html(index=False, na_rep="", border=0)}</div>'
+
+    def render_chart(self, proto):
+        self.charts += 1
+        chart_id = f"chart-{self.charts}"
+        config = json.loads(proto.figure.config or "{}")
+        config["responsive"] = True
+        # The figure JSON is embedded as is, only "</" is escaped to keep it inside the script
+        spec = proto.figure.spec.replace("</", "<\\/")
+        return (
+            f'<div id="{chart_id}"></div>\n<script>(function() {{ var figure = {spec}; '
+            f'Plotly.newPlot("{chart_id}", figure.data, figure.layout, {json.dumps(config)}); }})();</script>'
+        )
+
+    # Copy a media file of the rerun (image, download) into the site and link it
+    def media_link(self, url):
+        media = self.media_storage.get_file(url.rsplit("/", 1)[-1])
+        name = media.filename or url.rsplit("/", 1)[-1]
+        target = os.path.join("media", name)
+        path = os.path.join(self.site_dir, target)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as file:
+                file.write(media.content)
+        return link(self.file, target)
+
+
+def page_html(file, title, current_page, body, created):
+    nav = "".join(
+        f'<a href="{link(file, PAGE_FILES[page])}"{" class=current" if page == current_page else ""}>{page}</a>'
+        for page in PAGE_FILES
+    )
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{html.escape(title)}</title>
+<style>{PAGE_STYLE}</style>
+<script src="{link(file, 'assets/plotly.min.js')}"></script>
+</head>
+<body>
+<nav>{nav}</nav>
+<main>
+{body}
+<footer class="snapshot">Static snapshot of {created}.</footer>
+</main>
+</body>
+</html>
+"""
+
+
+# Run the app with the given widget values and write the rendered page
+def write_view(site_dir, media_storage, file, title, page, values, created, extra=""):
+    runner = HeadlessRunner(values={"page": page, **values})
+    _, result = runner.run_once()
+    if result["exceptions"]:
+        raise RuntimeError(f"{file}: {result['exceptions']}")
+    body = extra + DeltaRenderer(runner, media_storage, site_dir, file).render()
+    path = os.path.join(site_dir, file)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as output:
+        output.write(page_html(file, title, page, body, created))
+    return os.path.getsize(path)
+
+
+# Links to the Single View pages of all samples, grouped by reference and station
+def samples_index():
+    file = PAGE_FILES["Single View"]
+    parts = ["<h1>Single View</h1><p>Choose a sample: reference, station and depth in core (cm).</p>"]
+    for reference in sample_options():
+        parts.append(f"<h3>{html.escape(reference)}</h3><ul>")
+        for station in sample_options(reference):
+            depths = ", ".join(
+                f'<a href="{link(file, sample_file(reference, station, depth))}">{depth:g}</a>'
+                for depth in sample_options(reference, station)
+            )
+            parts.append(f"<li>Station {html.escape(str(station))}: {depths}</li>")
+        parts.append("</ul>")
+    return "\n".join(parts)
+
+
+# Render the snapshot into `site_dir`. `limit` caps the number of Single View
+# samples (all by default). Returns the manifest of the written files.
+def build_snapshot(site_dir=SITE_DIR, limit=None, progress=print):
+    media_storage = install_runtime()
+
+    shutil.rmtree(site_dir, ignore_errors=True)
+    os.makedirs(os.path.join(site_dir, "assets"))
+    with open(os.path.join(site_dir, "assets", "plotly.min.js"), "w", encoding="utf-8") as file:
+        file.write(get_plotlyjs())
+    created = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
+    files = {}
+
+    for page, file in PAGE_FILES.items():
+        if page == "Single View":
+            body = samples_index()
+            path = os.path.join(site_dir, file)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as output:
+                output.write(page_html(file, page, page, body, created))
+            files[file] = os.path.getsize(path)
+        else:
+            files[file] = write_view(site_dir, media_storage, file, page, page, {}, created)
+        progress(f"  {file}")
+
+    samples = [
+        (reference, station, depth)
+        for reference in sample_options()
+        for station in sample_options(reference)
+        for depth in sample_options(reference, station)
+    ][:limit]
+    for number, (reference, station, depth) in enumerate(samples, start=1):
+        file = sample_file(reference, station, depth)
+        siblings = " · ".join(
+            f"<strong>{other:g}</strong>" if other == depth else
+            f'<a href="{link(file, sample_file(reference, station, other))}">{other:g}</a>'
+            for other in sample_options(reference, station)
+        )
+        extra = f'<p class="caption">Depths in core (cm) of this station: {siblings}</p>'
+        values = {
+            "single_view_reference": reference,
+            "single_view_station": station,
+            "single_view_depth": depth,
+            "depth_analysis_reference": reference,
+            "depth_analysis_station": station,
+        }
+        title = f"{reference}, station {station}, {depth:g} cm"
+        files[file] = write_view(site_dir, media_storage, file, title, "Single View", values, created, extra)
+        if number % 50 == 0 or number == len(samples):
+            progress(f"  {number}/{len(samples)} samples")
+
+    manifest = {"data_hash": data_hash(), "created": created, "files": files}
+    with open(os.path.join(site_dir, "manifest.json"), "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2, ensure_ascii=False)
+    return manifest
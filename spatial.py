@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+from dataset import load_metadata, load_sample_index, samples_version
+from profiling import timed
+
+# Spatial index of the stations: a uniform grid over their coordinates. The
+# stations are sorted by grid cell and each cell is a contiguous slice of that
+# order, so a bounding box is answered with one slice per grid row plus an exact
+# test of the candidates; a polygon (lasso) is answered from the candidates of its
+# bounding box with a vectorized point-in-polygon test.
+
+# Average number of stations per grid cell
+POINTS_PER_CELL = 4
+
+
+# Grid index over points given by their latitudes and longitudes
+def build_grid(lat, lon, points_per_cell=POINTS_PER_CELL):
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    bounds = (lat.min(), lat.max(), lon.min(), lon.max()) if len(lat) else (0.0, 0.0, 0.0, 0.0)
+    height = max(bounds[1] - bounds[0], 1e-9)
+    width = max(bounds[3] - bounds[2], 1e-9)
+    # Square cells, about `points_per_cell` points per cell on average
+    cell = max(np.sqrt(height * width * points_per_cell / max(len(lat), 1)), 1e-9)
+    rows, cols = int(height // cell) + 1, int(width // cell) + 1
+    cells = _cell_row(bounds, cell, rows, lat) * cols + _cell_col(bounds, cell, cols, lon)
+    order = np.argsort(cells, kind="stable")
+    starts = np.searchsorted(cells[order], np.arange(rows * cols + 1))
+    return {
+        "lat": lat, "lon": lon, "bounds": bounds, "cell": cell, "rows": rows, "cols": cols,
+        "order": order, "starts": starts,
+    }
+
+
+def _cell_row(bounds, cell, rows, lat):
+    return np.clip(((np.asarray(lat) - bounds[0]) // cell).astype(np.int64), 0, rows - 1)
+
+
+def _cell_col(bounds, cell, cols, lon):
+    return np.clip(((np.asarray(lon) - bounds[2]) // cell).astype(np.int64), 0, cols - 1)
+
+
+# Points inside a bounding box (edges included), as sorted positions
+def query_box(grid, lat_min, lat_max, lon_min, lon_max):
+    bounds = grid["bounds"]
+    if lat_min > bounds[1] or lat_max < bounds[0] or lon_min > bounds[3] or lon_max < bounds[2]:
+        return np.array([], dtype=np.int64)
+    cell, cols = grid["cell"], grid["cols"]
+    row_min, row_max = _cell_row(bounds, cell, grid["rows"], [lat_min, lat_max])
+    col_min, col_max = _cell_col(bounds, cell, cols, [lon_min, lon_max])
+    # The cells of a grid row are contiguous in the order of the points
+    starts = grid["starts"]
+    first = np.arange(row_min, row_max + 1) * cols + col_min
+    slices = [grid["order"][starts[start]:starts[start + col_max - col_min + 1]] for start in first]
+    candidates = np.concatenate(slices) if slices else np.array([], dtype=np.int64)
+    lat, lon = grid["lat"][candidates], grid["lon"][candidates]
+    inside = (lat >= lat_min) & (lat <= lat_max) & (lon >= lon_min) & (lon <= lon_max)
+    return np.sort(candidates[inside])
+
+
+# Which points are inside a polygon given as (lat, lon) vertices (even-odd rule)
+def points_in_polygon(lat, lon, polygon):
+    vertices = np.asarray(polygon, dtype=float)
+    lat_1, lon_1 = vertices[:, 0], vertices[:, 1]
+    lat_2, lon_2 = np.roll(lat_1, -1), np.roll(lon_1, -1)
+    lat = np.asarray(lat, dtype=float)[:, None]
+    lon = np.asarray(lon, dtype=float)[:, None]
+    # Edges crossed by a ray from each point towards increasing longitude
+    spans = (lat_1 > lat) != (lat_2 > lat)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crossing = lon_1 + (lat - lat_1) * (lon_2 - lon_1) / (lat_2 - lat_1)
+    return (np.count_nonzero(spans & (lon < crossing), axis=1) % 2) == 1
+
+
+# Points inside a polygon (lasso) of at least three (lat, lon) vertices, as sorted positions
+def query_polygon(grid, polygon):
+    vertices = np.asarray(polygon, dtype=float)
+    candidates = query_box(grid, vertices[:, 0].min(), vertices[:, 0].max(), vertices[:, 1].min(), vertices[:, 1].max())
+    inside = points_in_polygon(grid["lat"][candidates], grid["lon"][candidates], vertices)
+    return candidates[inside]
+
+
+# One row per station (Reference, Station) with the coordinates of its first
+# sample and the positions of its samples, and the grid index over them
+@st.cache_resource(max_entries=1, show_spinner=False)
+def _build_station_index(version):
+    metadata = load_metadata()
+    rows = load_sample_index()["rows"]
+    keys = [key for key in rows if len(key) == 2]
+    first = np.array([rows[key][0] for key in keys], dtype=np.int64)
+    stations = pd.DataFrame({
+        "Reference": [key[0] for key in keys],
+        "Station": [key[1] for key in keys],
+        "Lat": metadata["Lat"].to_numpy(dtype=float)[first],
+        "Long": metadata["Long"].to_numpy(dtype=float)[first],
+        "Samples": [len(rows[key]) for key in keys],
+    })
+    return {"stations": stations, "grid": build_grid(stations["Lat"], stations["Long"])}
+
+
+def load_station_index():
+    with timed("load", "station index"):
+        return _build_station_index(samples_version())
+
+
+# Stations in a bounding box or a polygon, as a frame with one row per station
+def stations_in_box(lat_min, lat_max, lon_min, lon_max):
+    index = load_station_index()
+    with timed("filter", "stations in box"):
+        return index["stations"].iloc[query_box(index["grid"], lat_min, lat_max, lon_min, lon_max)]
+
+
+def stations_in_polygon(polygon):
+    index = load_station_index()
+    with timed("filter", "stations in polygon"):
+        return index["stations"].iloc[query_polygon(index["grid"], polygon)]
@@ -0,0 +1,67 @@
+import math
+import pandas as pd
+import streamlit as st
+from abundance import abundance_frame, summed_abundances
+from dataset import load_abundance
+from profiling import timed
+from schema import MISSING
+
+# Paged view of a samples x taxa table. Only the visible window (a page of rows and
+# a group of taxon columns) is built and sent to the browser, instead of the whole
+# wide frame through a Styler. Taxa are ordered by their total abundance in the
+# table, so the first group holds the dominant taxa and the others are shown on demand.
+
+# Rows per page and taxon columns per group
+ROWS_PER_PAGE = 50
+TAXA_PER_GROUP = 25
+
+
+# Taxa present in the given rows, from the most to the least abundant
+def ranked_taxa(abundance, rows):
+    totals = summed_abundances(abundance, rows)
+    return list(totals.sort_values(ascending=False, kind="stable").index)
+
+
+# Labels of the taxon groups, e.g. "Top 25 taxa", "Taxa 26-50", ...
+def taxon_group_labels(count):
+    labels = []
+    for start in range(0, count, TAXA_PER_GROUP):
+        end = min(start + TAXA_PER_GROUP, count)
+        labels.append(f"Top {end} taxa" if start == 0 else f"Taxa {start + 1}-{end}")
+    return labels
+
+
+# Window of the table: metadata columns plus the abundances of a group of taxa,
+# for one page of the samples at positions `rows` of the metadata/abundance matrix
+def table_window(metadata, rows, taxa, page, group):
+    page_rows = rows[page * ROWS_PER_PAGE:(page + 1) * ROWS_PER_PAGE]
+    group_taxa = taxa[group * TAXA_PER_GROUP:(group + 1) * TAXA_PER_GROUP]
+    page_metadata = metadata.loc[page_rows]
+    abundances = abundance_frame(load_abundance(), page_rows, group_taxa, index=page_metadata.index)
+    return pd.concat([page_metadata, abundances], axis=1)
+
+
+# Paged table of the samples at positions `rows`, showing the given metadata
+# columns next to the taxa found in them. `key` keeps the widgets of different
+# tables apart.
+def show_paged_table(metadata, rows, key):
+    abundance = load_abundance()
+    with timed("filter", "ranked taxa"):
+        taxa = ranked_taxa(abundance, rows)
+    pages = max(1, math.ceil(len(rows) / ROWS_PER_PAGE))
+
+    col1, col2 = st.columns(2)
+    with col1:
+        groups = taxon_group_labels(len(taxa)) or ["No taxa"]
+        group = groups.index(st.selectbox("Taxa:", groups, key=f"{key}_taxa"))
+    with col2:
+        page = st.number_input(f"Page (of {pages}):", min_value=1, max_value=pages, value=1, key=f"{key}_page") - 1
+
+    with timed("filter", "table window"):
+        window = table_window(metadata, rows, taxa, page, group)
+    st.dataframe(window.style.format(precision=2, na_rep=MISSING))
+
+    if len(rows):
+        first = page * ROWS_PER_PAGE + 1
+        last = min((page + 1) * ROWS_PER_PAGE, len(rows))
+        st.caption(f"Samples {first}-{last} of {len(rows)}, {len(taxa)} taxa found.")
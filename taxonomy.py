@@ -0,0 +1,131 @@
+import re
+import pandas as pd
+import streamlit as st
+from abundance import aggregate_abundance
+from dataset import load_abundance, read_dataset, samples_version, source_hash
+from profiling import timed
+
+# Taxonomic index of the taxa list (taxa.xlsx), parsed once per version of the file.
+# Every taxon code of the list has an accepted name (the WoRMS name when the list
+# gives one, else its own name, without the authority) and a genus. The rows without
+# a code below a taxon list the names the original studies used for it
+# ("A: Ammonia sp. 1, sp. 2; B: Ammonia spp."): they are resolved to that taxon.
+# The abundance matrix is aggregated to the accepted names or to the genera with
+# one sparse product (see aggregate_abundance), once per level.
+
+# Taxonomic levels offered in the views: the taxa as recorded in the studies,
+# their accepted names (synonyms merged) and their genera
+LEVELS = ["Taxon", "Species", "Genus"]
+
+# Lower-case words that start the authority of a name (e.g. "de Folin, 1887")
+AUTHOR_PARTICLES = {"in", "and", "et", "de", "del", "di", "von", "van", "le", "la", "du"}
+
+# Label of a study in the synonym notes, e.g. "A:" or "B."
+NOTE_LABEL = re.compile(r"(?:^|[\s;])[A-Z][:.]\s")
+
+
+# Key to match taxon names written differently, e.g. "Ammonia  tepida" and "ammonia_tepida"
+def taxon_key(name):
+    return re.sub(r"[\s_]+", "_", str(name).strip()).lower()
+
+
+# Scientific name without its authority: "Ammonia batava (Hofker, 1951)" ->
+# "Ammonia batava", "Biloculina labiata var. depressa Wiesner, 1923" ->
+# "Biloculina labiata var. depressa"
+def strip_authority(name):
+    words = str(name).replace("_", " ").split()
+    if not words:
+        return ""
+    kept = [words[0]]
+    for word in words[1:]:
+        if word in AUTHOR_PARTICLES or not re.fullmatch(r"[a-z][a-z\-]*\.?", word):
+            break
+        kept.append(word)
+    return " ".join(kept)
+
+
+# Names listed in a synonym note, without their authority
+def note_names(note):
+    names = []
+    for part in NOTE_LABEL.split(str(note)):
+        for fragment in re.split(r";|,| and ", part):
+            name = strip_authority(fragment.strip())
+            if len(name.split()) >= 2 and name[0].isupper():
+                names.append(name)
+    return names
+
+
+# Accepted name and genus of every code of the taxa list, and the code of every
+# name (codes, names, accepted names and synonyms) by taxon_key
+def build_taxonomy(taxa_list):
+    accepted, genus, names, synonyms = {}, {}, {}, {}
+    code = None
+    for row in taxa_list.itertuples(index=False):
+        taxon_code, taxon_name, accepted_name = row
+        if pd.notna(taxon_code):
+            code = str(taxon_code).strip()
+            for name in (accepted_name, taxon_name, code):
+                if pd.notna(name) and strip_authority(name):
+                    accepted[code] = strip_authority(name)
+                    break
+            genus[code] = accepted[code].split()[0]
+            for name in (code, taxon_name):
+                if pd.notna(name):
+                    names.setdefault(taxon_key(strip_authority(name)), code)
+        elif code is not None and pd.notna(accepted_name):
+            # Names used by the studies for the taxon above
+            for name in note_names(accepted_name):
+                synonyms.setdefault(taxon_key(name), code)
+    # The names of the list win over the synonyms, and both over the accepted names
+    for key, value in synonyms.items():
+        names.setdefault(key, value)
+    for value, name in accepted.items():
+        names.setdefault(taxon_key(name), value)
+    return {"accepted": accepted, "genus": genus, "names": names}
+
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def _read_taxonomy(sha256):
+    taxa_list = read_dataset("taxa")
+    return build_taxonomy(taxa_list[["Taxon code", "Taxon name", "Accepted name WORMS"]])
+
+
+def load_taxonomy():
+    with timed("load", "taxonomy"):
+        return _read_taxonomy(source_hash("taxa"))
+
+
+# Code of the taxa list for a name written in any of its forms, or None
+def resolve_taxon(name):
+    return load_taxonomy()["names"].get(taxon_key(strip_authority(name)))
+
+
+# Label of every taxon at a level. Taxa missing from the taxa list keep their own
+# name, with the first word as genus.
+def taxon_labels(taxa, level):
+    taxonomy = load_taxonomy()
+    labels = []
+    for name in taxa:
+        code = taxonomy["names"].get(taxon_key(name), name)
+        species = taxonomy["accepted"].get(code, str(name).replace("_", " "))
+        labels.append(species if level == "Species" else taxonomy["genus"].get(code, species.split()[0]))
+    return labels
+
+
+@st.cache_resource(max_entries=len(LEVELS), show_spinner=False)
+def _level_abundance(data_hash, taxa_hash, level, _abundance):
+    return aggregate_abundance(_abundance, taxon_labels(_abundance["taxa"], level))
+
+
+# Abundances of the samples at a taxonomic level, in the layout of load_abundance()
+def level_abundance(level):
+    abundance = load_abundance()
+    if level == "Taxon":
+        return abundance
+    with timed("load", f"abundance by {level.lower()}"):
+        return _level_abundance(abundance["hash"], source_hash("taxa"), level, abundance)
+
+
+# Version of the abundances at a level, for the cache keys of results derived from them
+def level_version(level):
+    return samples_version(), None if level == "Taxon" else source_hash("taxa")